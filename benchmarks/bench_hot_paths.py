@@ -0,0 +1,77 @@
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from conf.settings import MATCHMAKING_BATCH_SIZE
+from services.match_results import rate_matches
+from services.matchmaking_scheduler import MatchmakingScheduler
+from services.pairing import GREEDY, OPTIMAL, WINDOWED_GREEDY
+from services.rating_writer import rating_writer
+from services.user_matchmaking import MM
+
+
+@pytest.fixture
+def no_rating_flush(monkeypatch):
+    """Ratings stay pending in memory, DB is not touched"""
+    monkeypatch.setattr(rating_writer, "flush_size", float("inf"))
+    monkeypatch.setattr(rating_writer, "flush_interval", float("inf"))
+    yield
+    rating_writer._pending.clear()
+
+
+def players(queue):
+    return [SimpleNamespace(uuid=user["uuid"], mu=user["mu"], sigma=user["sigma"]) for user in queue]
+
+
+def bench_get_match_probability(benchmark, queue):
+    """One player against the whole queue, one trueskill call per enemy"""
+    user, *enemies = queue
+    benchmark(lambda: [MM.get_match_probability((user["mu"], user["sigma"]), (e["mu"], e["sigma"])) for e in enemies])
+
+
+def bench_get_match_probabilities(benchmark, queue):
+    user, *enemies = queue
+    benchmark(MM.get_match_probabilities, user, enemies)
+
+
+def bench_calculate_mu_sigma_for_users(benchmark, queue):
+    """Every pair of the queue plays one match"""
+    users = players(queue)
+    benchmark(lambda: [MM.calculate_mu_sigma_for_users(*users[i : i + 2]) for i in range(0, len(users) - 1, 2)])
+
+
+def bench_rate_matches(benchmark, queue):
+    mus = np.array([user["mu"] for user in queue])
+    sigmas = np.array([user["sigma"] for user in queue])
+    winners = np.arange(0, len(queue) - 1, 2)
+    benchmark(rate_matches, mus, sigmas, winners, winners + 1)
+
+
+def bench_match_1_vs_1_random_winner(benchmark, redis_server, queue, no_rating_flush):
+    """New ratings are also sent to the leaderboard"""
+    users = players(queue)
+    benchmark(lambda: [MM.match_1_vs_1_random_winner(users[i : i + 2]) for i in range(0, len(users) - 1, 2)])
+
+
+def bench_storage_iter(benchmark, storage):
+    """Whole queue read and decoded"""
+    benchmark(lambda: list(storage))
+
+
+def bench_find_enemy_full_scan(benchmark, storage):
+    """One player reads the whole queue and searches an enemy in it"""
+    benchmark(lambda: MM.find_enemy(next(iter(storage)), 0, storage))
+
+
+@pytest.mark.parametrize("mode", [GREEDY, WINDOWED_GREEDY, OPTIMAL])
+def bench_scheduler_pair(benchmark, event_loop, async_storage, mode):
+    """One matchmaking tick without claiming: oldest users, their mu windows and pairing"""
+    scheduler = MatchmakingScheduler(async_storage, mode=mode)
+    now = time.time()
+
+    async def pair():
+        return await scheduler.pair(await async_storage.oldest(MATCHMAKING_BATCH_SIZE), now)
+
+    benchmark(lambda: event_loop.run_until_complete(pair()))
@@ -0,0 +1,93 @@
+"""
+Microbenchmarks of rating and queue hot paths, offline against ``fakeredis``::
+
+    pytest benchmarks --benchmark-save=baseline
+    pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:15%
+    pytest benchmarks --queue-sizes=100,1000
+
+Baselines are saved as JSON in ``benchmarks/.benchmarks``, comparison fails on slowdowns above the threshold.
+"""
+import asyncio
+import json
+import time
+import uuid
+
+import fakeredis
+import fakeredis.aioredis
+import numpy as np
+import pytest
+
+from services.redis_hash import AsyncRedisHMapMatchmakingStorage, RedisHMapMatchmakingStorage
+from services.redis_pool import close_redis, use_redis
+
+QUEUE_SIZES = (100, 1_000, 10_000, 100_000)
+QUEUE_NAME = "BenchmarkQueue"
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--queue-sizes",
+        default=",".join(map(str, QUEUE_SIZES)),
+        help="comma separated queue sizes every benchmark runs at",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "queue_size" in metafunc.fixturenames:
+        sizes = [int(size) for size in metafunc.config.getoption("queue_sizes").split(",")]
+        metafunc.parametrize("queue_size", sizes, scope="session")
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.run_until_complete(close_redis())
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def redis_server():
+    server = fakeredis.FakeServer()
+    use_redis(lambda: fakeredis.aioredis.create_redis_pool(server), lambda: fakeredis.FakeRedis(server=server))
+    return server
+
+
+@pytest.fixture(scope="session")
+def queue(queue_size):
+    """Waiting users, same for every run"""
+    rng = np.random.default_rng(queue_size)
+    mus = rng.normal(25, 8, queue_size)
+    sigmas = rng.uniform(1, 8.333, queue_size)
+    joined_at = time.time() - rng.uniform(0, 30, queue_size)
+    return [
+        {"uuid": str(uuid.UUID(int=index)), "mu": mu, "sigma": sigma, "joined_at": joined}
+        for index, (mu, sigma, joined) in enumerate(zip(mus.tolist(), sigmas.tolist(), joined_at.tolist()))
+    ]
+
+
+@pytest.fixture(scope="session")
+def storage(redis_server, queue):
+    """Queue stored in Redis, replaced for every queue size"""
+    storage = RedisHMapMatchmakingStorage(QUEUE_NAME)
+    client = storage._redis
+    client.delete(
+        storage.name,
+        storage.mu_index,
+        storage.joined_index,
+        storage.seen_index,
+        *client.keys(f"{storage.pair_prefix}*"),
+    )
+    client.hset(
+        storage.name,
+        mapping={user["uuid"]: json.dumps({k: user[k] for k in ("mu", "sigma", "joined_at")}) for user in queue},
+    )
+    client.zadd(storage.mu_index, {user["uuid"]: user["mu"] for user in queue})
+    client.zadd(storage.joined_index, {user["uuid"]: user["joined_at"] for user in queue})
+    client.zadd(storage.seen_index, {user["uuid"]: user["joined_at"] for user in queue})
+    return storage
+
+
+@pytest.fixture(scope="session")
+def async_storage(storage):
+    return AsyncRedisHMapMatchmakingStorage(storage.name)
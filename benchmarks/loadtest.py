@@ -0,0 +1,166 @@
+"""
+Load test of the whole websocket matchmaking flow, offline.
+
+Every simulated client goes connect -> introduced -> find_match -> found_match -> match_finished
+against ``conf.asgi.application``. Redis is replaced with ``fakeredis``, the channel layer with
+``InMemoryChannelLayer`` and DB with a temporary SQLite file::
+
+    python -m benchmarks.loadtest --clients 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import fakeredis
+import fakeredis.aioredis
+import numpy as np
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "conf.settings")
+
+
+@dataclass
+class ClientResult:
+    connected_in: float = 0.0
+    time_to_match: Optional[float] = None
+    messages: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class Report:
+    clients: int
+    seconds: float
+    results: List[ClientResult] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, Any]:
+        matched = np.array([r.time_to_match for r in self.results if r.time_to_match is not None])
+        connect_seconds = max((r.connected_in for r in self.results), default=0.0)
+        p50, p95, p99 = np.percentile(matched, [50, 95, 99]).tolist() if len(matched) else (0.0, 0.0, 0.0)
+        messages = sum(r.messages for r in self.results)
+        return {
+            "clients": self.clients,
+            "matched": int(len(matched)),
+            "errors": dict(Counter(r.error for r in self.results if r.error is not None)),
+            "seconds": self.seconds,
+            "connections_per_second": self.clients / connect_seconds if connect_seconds else 0.0,
+            "time_to_match_p50": p50,
+            "time_to_match_p95": p95,
+            "time_to_match_p99": p99,
+            "messages_per_second": messages / self.seconds if self.seconds else 0.0,
+            # kilobytes on Linux
+            "peak_memory_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+
+def setup_offline(db_path: str) -> None:
+    """In-memory Redis and channel layer, SQLite DB in ``db_path``. Must run before Django is set up"""
+    import django
+    from django.conf import settings
+    from django.core.management import call_command
+
+    from services.redis_pool import use_redis
+
+    server = fakeredis.FakeServer()
+    use_redis(
+        lambda: fakeredis.aioredis.create_redis_pool(server),
+        lambda: fakeredis.FakeRedis(server=server),
+    )
+    settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    settings.DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": db_path}}
+    django.setup()
+    call_command("migrate", verbosity=0)
+
+
+async def run_client(application, started: float, timeout: float) -> ClientResult:
+    """First User of ``found_match`` finishes the match, so every pair finishes once"""
+    from channels.testing import WebsocketCommunicator
+
+    result = ClientResult()
+    communicator = WebsocketCommunicator(application, "/ws/basic")
+    step = "connect"
+    try:
+        await communicator.connect(timeout=timeout)
+        result.connected_in = time.perf_counter() - started
+
+        step = "introduced"
+        await communicator.send_json_to({"type": "introduced"})
+        user = (await communicator.receive_json_from(timeout=timeout))["message"]["user"]
+        step = "found_match"
+        searched_at = time.perf_counter()
+        await communicator.send_json_to({"type": "matchmaking", "message": {"type": "find_match"}})
+        result.messages += 2
+        found_match, received = await receive_until(communicator, "found_match", timeout)
+        result.messages += received
+        result.time_to_match = time.perf_counter() - searched_at
+
+        step = "match_finished"
+        if found_match["message"]["user0"] == user:
+            await communicator.send_json_to({"type": "matchmaking", "message": {"type": "match_finished"}})
+            result.messages += 1
+        result.messages += (await receive_until(communicator, "match_finished", timeout))[1]
+    except asyncio.TimeoutError:
+        # application of client is cancelled on timeout, nothing to disconnect
+        result.error = f"timeout waiting for {step}"
+        return result
+    await communicator.disconnect()
+    return result
+
+
+async def receive_until(communicator, message_type: str, timeout: float) -> Tuple[dict, int]:
+    """Receive messages until one of ``message_type``, returns it and how many were received"""
+    received = 1
+    message = await communicator.receive_json_from(timeout=timeout)
+    while message["type"] != message_type:
+        message = await communicator.receive_json_from(timeout=timeout)
+        received += 1
+    return message, received
+
+
+async def run(clients: int, timeout: float) -> Report:
+    from conf.asgi import application
+    from services.identity import identity
+    from services.match_history import match_history
+    from services.rating_writer import rating_writer
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run_client(application, started, timeout) for _ in range(clients)))
+    report = Report(clients=clients, seconds=time.perf_counter() - started, results=list(results))
+
+    from channels.db import database_sync_to_async
+
+    await database_sync_to_async(identity.flush)()
+    await database_sync_to_async(rating_writer.flush)()
+    await database_sync_to_async(match_history.flush)()
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=1000, help="simulated clients, rounded up to even")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for every message")
+    parser.add_argument("--tick-interval", type=float, default=None, help="seconds between matchmaking rounds")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_offline(os.path.join(tmp, "loadtest.sqlite3"))
+        if args.tick_interval is not None:
+            from services.matchmaking_scheduler import scheduler
+
+            for shard_scheduler in scheduler.schedulers.values():
+                shard_scheduler.tick_interval = args.tick_interval
+        report = asyncio.run(run(args.clients + args.clients % 2, args.timeout)).as_dict()
+
+    sys.stdout.write(json.dumps(report, indent=2) + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -11,16 +11,21 @@ import os
 
 import django
 from channels.http import AsgiHandler
-from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.routing import ChannelNameRouter, ProtocolTypeRouter, URLRouter
 
 import workers.routing
+from conf.settings import MATCHMAKING_WORKER_CHANNEL
+from workers.matchmaker import MatchmakerConsumer, MatchmakingStartup
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "conf.settings")
 django.setup()
 
-application = ProtocolTypeRouter(
-    {
-        "http": AsgiHandler(),
-        "websocket": URLRouter(workers.routing.websocket_urlpatterns),
-    }
+application = MatchmakingStartup(
+    ProtocolTypeRouter(
+        {
+            "http": AsgiHandler(),
+            "websocket": URLRouter(workers.routing.websocket_urlpatterns),
+            "channel": ChannelNameRouter({MATCHMAKING_WORKER_CHANNEL: MatchmakerConsumer.as_asgi()}),
+        }
+    )
 )
@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/3.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -105,6 +106,10 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REDIS_HOST = "host.docker.internal"
 REDIS_PORT = "6379"
+REDIS_DB = 1
+# Asyncio connections shared by all consumers of one process
+REDIS_POOL_MINSIZE = 1
+REDIS_POOL_MAXSIZE = 20
 
 CHANNEL_LAYERS = {
     "default": {
@@ -115,6 +120,73 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Matchmaking
+# Seconds between two matchmaking rounds and max players paired per round
+MATCHMAKING_TICK_INTERVAL = 1
+MATCHMAKING_BATCH_SIZE = 500
+# Max enemies fetched from rating index on each side of player's mu
+MATCHMAKING_WINDOW_LIMIT = 50
+# "greedy", "windowed_greedy" or "optimal", see services.pairing
+MATCHMAKING_PAIRING_MODE = "optimal"
+# Seconds a claimed pair is remembered after leaving the queue
+MATCHMAKING_PAIR_TTL = 60
+# Queue is split by game mode and by rating band, bands are this many mu wide around default mu.
+# Users are also matched with users of adjacent bands
+MATCHMAKING_MODES = ("default",)
+MATCHMAKING_DEFAULT_MODE = "default"
+MATCHMAKING_SHARD_COUNT = 4
+MATCHMAKING_SHARD_BAND_WIDTH = 8
+# Process with index i matches shards i, i + count, i + 2 * count, ... of all shards
+MATCHMAKING_PROCESS_INDEX = int(os.environ.get("MATCHMAKING_PROCESS_INDEX", 0))
+MATCHMAKING_PROCESS_COUNT = int(os.environ.get("MATCHMAKING_PROCESS_COUNT", 1))
+# Match in separate worker processes, not in websocket servers: python manage.py runmatchmaker
+MATCHMAKING_WORKER = False
+MATCHMAKING_WORKER_CHANNEL = "matchmaker"
+# Waiting users refresh their queue entry every heartbeat interval seconds while connected.
+# Entries not refreshed for entry ttl seconds are swept out of the queue every sweep interval seconds
+MATCHMAKING_HEARTBEAT_INTERVAL = 10
+MATCHMAKING_ENTRY_TTL = 30
+MATCHMAKING_SWEEP_INTERVAL = 5
+# Max background tasks of websocket consumers, e.g. searches of waiting users, running at once in one process
+BACKGROUND_TASKS_LIMIT = 10000
+# Seconds a room of not finished match is kept in Redis
+ROOM_TTL = 3600
+# Also save every match as Room row in DB
+MATCH_HISTORY_ROOMS = False
+
+# Ratings are saved in bulk once this many users are pending or every interval seconds.
+# Pending ratings are kept in the memory of the process which rated the match: other processes read
+# the saved rating from DB, up to RATING_FLUSH_INTERVAL seconds old, and lose it if the process crashes
+RATING_FLUSH_SIZE = 200
+RATING_FLUSH_INTERVAL = 5
+# Finished matches are appended to history in bulk once this many are pending or every interval seconds
+MATCH_HISTORY_FLUSH_SIZE = 500
+MATCH_HISTORY_FLUSH_INTERVAL = 5
+
+# Quality and rating math runs in this many processes, 0 runs it inline in event loop
+COMPUTE_POOL_WORKERS = 0
+# Computations above this many waiting for the pool run inline
+COMPUTE_POOL_MAX_PENDING = 64
+# Max ratings of concurrently finished matches computed in one call
+COMPUTE_POOL_BATCH_SIZE = 256
+
+# Max users returned by one leaderboard request
+LEADERBOARD_MAX_COUNT = 100
+
+# Players resumed from their token are kept in process memory
+IDENTITY_CACHE_SIZE = 10000
+IDENTITY_CACHE_TTL = 300
+
+# Counters, gauges and histograms served at /metrics, no-op when disabled
+METRICS_ENABLED = True
+
+# Profile 1 in N websocket messages, 0 turns profiling off
+PROFILING_SAMPLE_RATE = 0
+# Profiled messages handled slower than this are logged with time spent in DB, Redis, channel layer
+PROFILING_SLOW_SECONDS = 0.1
+# Totals of profiled messages are written to this JSON file on exit
+PROFILING_DUMP_PATH = None
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 AUTH_USER_MODEL = "game_auth.User"
@@ -14,8 +14,15 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
+
+from conf.settings import METRICS_ENABLED
+from conf.views import metrics_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("api/", include("game_auth.urls")),
 ]
+
+if METRICS_ENABLED:
+    urlpatterns.append(path("metrics", metrics_view, name="metrics"))
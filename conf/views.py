@@ -0,0 +1,8 @@
+from django.http import HttpResponse
+
+from services import metrics
+
+
+def metrics_view(_request):
+    """Metrics of this process in Prometheus text format"""
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -13,6 +13,7 @@ class UserAdmin(admin.ModelAdmin):
         "sigma",
         "rating",
     )
+    ordering = ("-rating",)
 
 
 @admin.register(Room)
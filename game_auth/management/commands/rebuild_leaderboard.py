@@ -0,0 +1,27 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from game_auth.models import User
+from services.leaderboard import leaderboard
+
+
+def rating_chunks(chunk_size: int):
+    """uuid -> rating of all users, ``chunk_size`` users per chunk"""
+    rows = User.objects.values_list("uuid", "rating").iterator(chunk_size=chunk_size)
+    while True:
+        chunk = {str(user_uuid): rating for user_uuid, rating in islice(rows, chunk_size)}
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = "Replace the leaderboard with ratings of all users from DB"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=10000, help="users read from DB at once")
+
+    def handle(self, *args, chunk_size, **options):
+        count = leaderboard.rebuild(rating_chunks(chunk_size))
+        self.stdout.write(f"Ranked {count} users")
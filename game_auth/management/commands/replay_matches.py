@@ -0,0 +1,48 @@
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from trueskill import global_env, TrueSkill
+
+from game_auth.models import User
+from services.match_history import HistoryReplay, history_chunks
+
+
+class Command(BaseCommand):
+    help = "Recompute mu and sigma of every player from match history, e.g. with new TrueSkill parameters"
+
+    def add_arguments(self, parser):
+        env = global_env()
+        parser.add_argument("--mu", type=float, default=env.mu)
+        parser.add_argument("--sigma", type=float, default=env.sigma)
+        parser.add_argument("--beta", type=float, default=env.beta)
+        parser.add_argument("--tau", type=float, default=env.tau)
+        parser.add_argument("--draw-probability", type=float, default=env.draw_probability)
+        parser.add_argument("--chunk-size", type=int, default=100_000, help="matches read from DB at once")
+        parser.add_argument("--save", action="store_true", help="save new ratings, matchmaking must be stopped")
+
+    def handle(self, *args, chunk_size, save, **options):
+        env = TrueSkill(**{name: options[name] for name in ("mu", "sigma", "beta", "tau", "draw_probability")})
+        started = time.perf_counter()
+        replay = HistoryReplay(env).replay(history_chunks(chunk_size))
+        seconds = time.perf_counter() - started
+        self.stdout.write(
+            f"Replayed {replay.matches} matches of {len(replay.players)} players "
+            f"in {replay.batches} batches, {seconds:.2f}s"
+        )
+        if save:
+            self.stdout.write(f"Saved {save_ratings(replay, chunk_size)} players")
+
+
+def save_ratings(replay: HistoryReplay, chunk_size: int) -> int:
+    saved = 0
+    ratings = replay.ratings()
+    while True:
+        chunk = {player: (mu, sigma) for player, mu, sigma in islice(ratings, chunk_size)}
+        if not chunk:
+            return saved
+        users = list(User.objects.filter(uuid__in=chunk).only("uuid", "mu", "sigma"))
+        for user in users:
+            user.mu, user.sigma = chunk[user.uuid]
+        User.objects.bulk_update(users, fields=["mu", "sigma"], batch_size=1000)
+        saved += len(users)
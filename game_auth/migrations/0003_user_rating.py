@@ -0,0 +1,50 @@
+from django.db import migrations, models
+from django.db.models import F
+
+import game_auth.models
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def backfill_rating(apps, schema_editor):
+    """Every chunk is its own short transaction, rows are not locked for the whole backfill"""
+    User = apps.get_model("game_auth", "User")  # noqa: N806
+    last_uuid = None
+    while True:
+        users = User.objects.order_by("uuid")
+        if last_uuid is not None:
+            users = users.filter(uuid__gt=last_uuid)
+        chunk = list(users.values_list("uuid", flat=True)[:BACKFILL_CHUNK_SIZE])
+        if not chunk:
+            return
+        # MM.calculate_rating as of this migration
+        User.objects.filter(uuid__in=chunk).update(rating=10 * (10 * F("mu") - 3 * F("sigma")))
+        last_uuid = chunk[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("game_auth", "0002_room"),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name="user",
+            managers=[
+                ("objects", game_auth.models.RatedUserManager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="rating",
+            field=models.FloatField(null=True, editable=False),
+        ),
+        migrations.RunPython(backfill_rating, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="user",
+            name="rating",
+            field=models.FloatField(db_index=True, default=2250.01, editable=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game_auth", "0003_user_rating"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Match",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("winner", models.UUIDField()),
+                ("loser", models.UUIDField()),
+                ("played_at", models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
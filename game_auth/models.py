@@ -1,41 +1,68 @@
 import json
 import uuid as uuid
 
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
 
-from services.redis_hash import RedisHMap
+from services.channel_registry import ChannelNameRegistry
 from services.user_matchmaking import MM
 
-redis_storage_user_channel_name = RedisHMap("UserChannelName")
+user_channel_names = ChannelNameRegistry("UserChannelName")
+
+
+class UserQuerySet(models.QuerySet):
+    """Stored ``rating`` follows mu and sigma in bulk writes too"""
+
+    def update(self, **kwargs):
+        if ("mu" in kwargs or "sigma" in kwargs) and "rating" not in kwargs:
+            kwargs["rating"] = MM.calculate_rating(kwargs.get("mu", F("mu")), kwargs.get("sigma", F("sigma")))
+        return super().update(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for user in objs:
+            user.rating = MM.calculate_rating(user.mu, user.sigma)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if ("mu" in fields or "sigma" in fields) and "rating" not in fields:
+            objs = list(objs)
+            for user in objs:
+                user.rating = MM.calculate_rating(user.mu, user.sigma)
+            fields = [*fields, "rating"]
+        return super().bulk_update(objs, fields, batch_size=batch_size)
+
+    def rating_between(self, min_rating: float, max_rating: float):
+        return self.filter(rating__gte=min_rating, rating__lte=max_rating)
+
+
+class RatedUserManager(UserManager.from_queryset(UserQuerySet)):
+    pass
 
 
 class User(AbstractUser):
     uuid = models.UUIDField(primary_key=True, db_index=True, default=uuid.uuid4)
     mu = models.FloatField(default=25)
     sigma = models.FloatField(default=8.333)
+    # conservative rating, always MM.calculate_rating(mu, sigma), stored for DB-side sorting and range queries
+    rating = models.FloatField(default=MM.calculate_rating(25, 8.333), db_index=True, editable=False)
 
-    @property
-    def channel_name(self):
-        return redis_storage_user_channel_name[str(self.uuid)]
-
-    @channel_name.deleter
-    def channel_name(self):
-        redis_storage_user_channel_name.pop(self.channel_name)
-
-    @channel_name.setter
-    def channel_name(self, channel_name):
-        redis_storage_user_channel_name.add(str(self.uuid), channel_name)
-
-    @property
-    def rating(self):
-        return MM.calculate_rating(self.mu, self.sigma)
+    objects = RatedUserManager()
 
     @property
     def as_string(self):
         user_dict = {"uuid": str(self.uuid), "mu": self.mu, "sigma": self.sigma}
         return json.dumps(user_dict)
 
+    def save(self, *args, **kwargs):
+        self.rating = MM.calculate_rating(self.mu, self.sigma)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and ("mu" in update_fields or "sigma" in update_fields):
+            kwargs["update_fields"] = {*update_fields, "rating"}
+        super().save(*args, **kwargs)
+
     def update(self, mu: float, sigma: float) -> None:
         self.mu = mu
         self.sigma = sigma
@@ -50,3 +77,14 @@ class Room(models.Model):
 
     def __str__(self):
         return str(self.id)
+
+
+class Match(models.Model):
+    """Append-only history of rated 1 vs 1 matches, written in bulk"""
+
+    winner = models.UUIDField()
+    loser = models.UUIDField()
+    played_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.winner} > {self.loser}"
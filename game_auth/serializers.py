@@ -0,0 +1,23 @@
+from rest_framework import serializers
+
+from conf.settings import LEADERBOARD_MAX_COUNT
+
+
+class MatchResultSerializer(serializers.Serializer):
+    room = serializers.CharField(required=False, allow_blank=True)
+    players = serializers.ListField(child=serializers.UUIDField(), min_length=2, max_length=2)
+
+    def validate_players(self, players):
+        if players[0] == players[1]:
+            raise serializers.ValidationError("Players of a match must be different")
+        return players
+
+
+class BulkMatchResultsSerializer(serializers.Serializer):
+    """Finished matches in the order they were played, ``players`` from winner to looser"""
+
+    results = MatchResultSerializer(many=True, allow_empty=False)
+
+
+class LeaderboardQuerySerializer(serializers.Serializer):
+    count = serializers.IntegerField(min_value=1, max_value=LEADERBOARD_MAX_COUNT, default=10)
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from game_auth.views import BulkMatchResultsView, LeaderboardPlayerView, LeaderboardView
+
+urlpatterns = [
+    path("matches/bulk/", BulkMatchResultsView.as_view(), name="bulk-match-results"),
+    path("leaderboard/", LeaderboardView.as_view(), name="leaderboard"),
+    path("leaderboard/<uuid:user_uuid>/", LeaderboardPlayerView.as_view(), name="leaderboard-player"),
+]
@@ -0,0 +1,49 @@
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from game_auth.serializers import BulkMatchResultsSerializer, LeaderboardQuerySerializer
+from services.leaderboard import leaderboard
+from services.match_results import UnknownPlayersError, ingest_results
+
+
+class BulkMatchResultsView(APIView):
+    """Rate many finished matches at once, e.g. a burst of results from a game server"""
+
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = BulkMatchResultsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = [
+            tuple(str(user_uuid) for user_uuid in result["players"]) for result in serializer.validated_data["results"]
+        ]
+        try:
+            report = ingest_results(results)
+        except UnknownPlayersError as err:
+            return Response({"players": [str(err)]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_201_CREATED)
+
+
+class LeaderboardView(APIView):
+    """Best ``count`` users, cheap enough to be polled by game clients"""
+
+    def get(self, request):
+        serializer = LeaderboardQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response({"top": leaderboard.top(serializer.validated_data["count"])})
+
+
+class LeaderboardPlayerView(APIView):
+    """Rank of User and ``count`` users ranked above and below"""
+
+    def get(self, request, user_uuid):
+        serializer = LeaderboardQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        player = leaderboard.rank(str(user_uuid))
+        if player is None:
+            return Response({"detail": "User has no rating yet"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {"player": player, "around": leaderboard.around(str(user_uuid), serializer.validated_data["count"])}
+        )
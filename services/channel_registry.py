@@ -0,0 +1,48 @@
+from typing import Dict, List, Optional, Sequence
+
+from services.redis_hash import AsyncRedisHMap
+
+
+class ChannelNameRegistry:
+    """
+    User uuid -> channel name of the websocket connection.
+
+    Connections owned by this worker are kept in process memory, so looking them up costs nothing.
+    Connections of other workers are read from Redis, many uuids with one HMGET.
+    """
+
+    def __init__(self, structure_name: str):
+        self.storage = AsyncRedisHMap(structure_name)
+        self._local: Dict[str, str] = {}
+
+    def remember(self, user_uuid: str, channel_name: str) -> None:
+        self._local[user_uuid] = channel_name
+
+    def forget(self, user_uuid: str, channel_name: str) -> None:
+        if self._local.get(user_uuid) == channel_name:
+            del self._local[user_uuid]
+
+    async def register(self, user_uuid: str, channel_name: str) -> None:
+        """Connection opened on this worker"""
+        self.remember(user_uuid, channel_name)
+        await self.storage.add(user_uuid, channel_name)
+
+    async def unregister(self, user_uuid: str, channel_name: str) -> None:
+        """
+        Connection closed: invalidate cache and shared entry,
+        unless User was resumed on a newer connection which registered its own channel name
+        """
+        self.forget(user_uuid, channel_name)
+        await self.storage.pop_if_equal(user_uuid, channel_name)
+
+    async def get(self, user_uuid: str) -> Optional[str]:
+        return (await self.get_many([user_uuid]))[0]
+
+    async def get_many(self, users_uuids: Sequence[str]) -> List[Optional[str]]:
+        """Channel names in order of ``users_uuids``, None for users not connected"""
+        channel_names = [self._local.get(user_uuid) for user_uuid in users_uuids]
+        remote = [user_uuid for user_uuid, channel_name in zip(users_uuids, channel_names) if channel_name is None]
+        if not remote:
+            return channel_names
+        found = dict(zip(remote, await self.storage.get_many(remote)))
+        return [channel_name or found[user_uuid] for user_uuid, channel_name in zip(users_uuids, channel_names)]
@@ -0,0 +1,133 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from game_auth.models import User
+
+from channels.db import database_sync_to_async
+from django.core import signing
+
+from conf.settings import IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL
+from services.profiling import DB, profiled, profiler
+
+
+class UserIdentity:
+    """
+    Users of websocket connections.
+
+    Returning players are resumed from a signed token and served from a process cache.
+    New players are not saved on connect: they are inserted in bulk, together with
+    every other new player, only when one of them first needs a row in DB.
+    """
+
+    salt = "game_auth.identity"
+
+    def __init__(self, cache_size: int = IDENTITY_CACHE_SIZE, cache_ttl: float = IDENTITY_CACHE_TTL):
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+        self._unsaved: Dict[str, "User"] = {}
+        self._lock = threading.Lock()
+
+    def make_token(self, user: "User") -> str:
+        return signing.dumps(str(user.uuid), salt=self.salt)
+
+    def read_token(self, token: Optional[str]) -> Optional[str]:
+        """User uuid from token, None if token is missing or forged"""
+        if not token:
+            return None
+        try:
+            return signing.loads(token, salt=self.salt)
+        except signing.BadSignature:
+            return None
+
+    async def resume(self, token: Optional[str]) -> "User":
+        """User of token, or a new one. Costs no DB query for players in cache"""
+        user_uuid = self.read_token(token)
+        if user_uuid is None:
+            return self.new_user()
+        user = self._get_cached(user_uuid)
+        if user is None:
+            user = await self._find_user(user_uuid) or self.new_user(user_uuid)
+            self._put_cached(user)
+        return user
+
+    def new_user(self, user_uuid: Optional[str] = None) -> "User":
+        """Not saved User, see ``ensure_persisted``"""
+        from game_auth.models import User
+
+        user_uuid = user_uuid or str(uuid.uuid4())
+        user = User(uuid=user_uuid, username=user_uuid)
+        with self._lock:
+            self._unsaved[user_uuid] = user
+        self._put_cached(user)
+        return user
+
+    def is_persisted(self, user: "User") -> bool:
+        return str(user.uuid) not in self._unsaved
+
+    async def ensure_persisted(self, user: "User") -> None:
+        if not self.is_persisted(user):
+            with profiler.section(DB):
+                await database_sync_to_async(self.flush)()
+
+    def release(self, user: "User") -> None:
+        """Connection closed: never save User who did nothing"""
+        with self._lock:
+            if self._unsaved.pop(str(user.uuid), None) is not None:
+                self._cache.pop(str(user.uuid), None)
+
+    def flush(self) -> int:
+        """
+        Insert all new users with one query, synchronous
+
+        :return: int how many users were inserted
+        """
+        from game_auth.models import User
+
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, {}
+        if not unsaved:
+            return 0
+        try:
+            User.objects.bulk_create(unsaved.values(), ignore_conflicts=True)
+        except Exception:
+            with self._lock:
+                self._unsaved = {**unsaved, **self._unsaved}
+            raise
+        for user in unsaved.values():
+            user._state.adding = False
+        return len(unsaved)
+
+    def _get_cached(self, user_uuid: str) -> Optional["User"]:
+        with self._lock:
+            cached = self._cache.get(user_uuid)
+            if cached is None:
+                return None
+            cached_at, user = cached
+            if time.monotonic() - cached_at > self.cache_ttl:
+                del self._cache[user_uuid]
+                return None
+            self._cache.move_to_end(user_uuid)
+            return user
+
+    def _put_cached(self, user: "User") -> None:
+        with self._lock:
+            self._cache[str(user.uuid)] = (time.monotonic(), user)
+            self._cache.move_to_end(str(user.uuid))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    @staticmethod
+    @profiled(DB)
+    @database_sync_to_async
+    def _find_user(user_uuid: str) -> Optional["User"]:
+        from game_auth.models import User
+
+        return User.objects.filter(uuid=user_uuid).first()
+
+
+identity = UserIdentity()
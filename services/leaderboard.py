@@ -0,0 +1,85 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from services.metrics import timed
+from services.redis_pool import get_sync_redis, redis_operation_seconds
+
+
+class Leaderboard:
+    """
+    Conservative rating of every rated User in one sorted set ``uuid -> rating``.
+
+    Ranks start at 1 for the best rating, every query is O(log N + returned entries).
+    Updated with new ratings after every match, ``rebuild`` replaces it with ratings from DB.
+    """
+
+    def __init__(self, structure_name: str):
+        self.name = structure_name
+
+    @property
+    def _redis(self):
+        return get_sync_redis()
+
+    def __len__(self) -> int:
+        return self._redis.zcard(self.name)
+
+    @timed(redis_operation_seconds, "leaderboard_update")
+    def update(self, ratings: Dict[str, float]) -> None:
+        """:param ratings: uuid -> new rating"""
+        if ratings:
+            self._redis.zadd(self.name, ratings)
+
+    def top(self, count: int) -> List[dict]:
+        """Best ``count`` users: [{'uuid': str, 'rating': float, 'rank': int}]"""
+        return self._entries(0, count - 1)
+
+    def rank(self, user_uuid: str) -> Optional[dict]:
+        """Entry of User, None if User has no rating yet"""
+        position, rating = self._position(user_uuid)
+        if position is None:
+            return None
+        return {"uuid": user_uuid, "rating": rating, "rank": position + 1}
+
+    def around(self, user_uuid: str, count: int) -> List[dict]:
+        """User with ``count`` users ranked above and ``count`` below, empty if User has no rating yet"""
+        position, _ = self._position(user_uuid)
+        if position is None:
+            return []
+        return self._entries(max(position - count, 0), position + count)
+
+    def rebuild(self, chunks: Iterable[Dict[str, float]]) -> int:
+        """
+        Replace all ratings at once, readers see the old leaderboard until the new one is complete
+
+        :param chunks: uuid -> rating of all users, in chunks
+        :return: int how many users are ranked
+        """
+        building = f"{self.name}:rebuild"
+        self._redis.delete(building)
+        for ratings in chunks:
+            if ratings:
+                self._redis.zadd(building, ratings)
+        count = self._redis.zcard(building)
+        if count:
+            self._redis.rename(building, self.name)
+        else:
+            self._redis.delete(self.name)
+        return count
+
+    def _position(self, user_uuid: str) -> Tuple[Optional[int], Optional[float]]:
+        pipeline = self._redis.pipeline(transaction=False)
+        pipeline.zrevrank(self.name, user_uuid)
+        pipeline.zscore(self.name, user_uuid)
+        position, rating = pipeline.execute()
+        return position, rating
+
+    def _entries(self, start: int, end: int) -> List[dict]:
+        if end < start:
+            return []
+        entries = self._redis.zrevrange(self.name, start, end, withscores=True)
+        return [
+            {"uuid": user_uuid.decode(), "rating": rating, "rank": start + index + 1}
+            for index, (user_uuid, rating) in enumerate(entries)
+        ]
+
+
+leaderboard = Leaderboard("Leaderboard")
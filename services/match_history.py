@@ -0,0 +1,111 @@
+"""
+Append-only history of rated matches and full-history re-rating.
+
+Finished matches are collected in memory and appended with one ``bulk_create``.
+``HistoryReplay`` recomputes mu and sigma of every player from the whole history,
+e.g. after changing TrueSkill parameters: history is read in chunks in the order
+matches were played and every chunk is rated in vectorized batches of independent matches.
+"""
+import atexit
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.utils import timezone
+from trueskill import TrueSkill, global_env
+
+from conf.settings import MATCH_HISTORY_FLUSH_INTERVAL, MATCH_HISTORY_FLUSH_SIZE
+from services.match_results import rate_matches
+from services.write_behind import WriteBehind
+
+
+class MatchHistoryWriter(WriteBehind):
+    """Matches are saved once ``flush_size`` are pending or ``flush_interval`` seconds passed"""
+
+    task_name = "match_history"
+
+    def __init__(
+        self, flush_size: int = MATCH_HISTORY_FLUSH_SIZE, flush_interval: float = MATCH_HISTORY_FLUSH_INTERVAL
+    ):
+        super().__init__(flush_size, flush_interval)
+
+    def add(self, winner_uuid: str, loser_uuid: str) -> None:
+        with self._lock:
+            self._pending.append((winner_uuid, loser_uuid, timezone.now()))
+        self.flush_if_due()
+
+    def restore(self, pending: List[Tuple[str, str, datetime]]) -> None:
+        """Put back matches which were not saved, before the newer ones"""
+        with self._lock:
+            self._pending = pending + self._pending
+
+    def _empty(self) -> List[Tuple[str, str, datetime]]:
+        return []
+
+    def _save(self, pending: List[Tuple[str, str, datetime]]) -> int:
+        from game_auth.models import Match
+
+        matches = [Match(winner=winner, loser=loser, played_at=played_at) for winner, loser, played_at in pending]
+        Match.objects.bulk_create(matches, batch_size=self.flush_size)
+        return len(matches)
+
+
+match_history = MatchHistoryWriter()
+atexit.register(match_history.flush)
+
+
+def history_chunks(chunk_size: int) -> Iterator[List[Tuple[Hashable, Hashable]]]:
+    """(winner uuid, loser uuid) of every saved match in the order they were played, ``chunk_size`` per chunk"""
+    from game_auth.models import Match
+
+    rows = Match.objects.order_by("played_at", "id").values_list("winner", "loser").iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class HistoryReplay:
+    """
+    Ratings of all players recomputed from history, every player starts with default mu and sigma of ``env``
+
+    :param env: trueskill environment to rate with, global one by default
+    """
+
+    def __init__(self, env: Optional[TrueSkill] = None):
+        self.env = env or global_env()
+        self.players: Dict[Hashable, int] = {}
+        self.mus = np.empty(0, dtype=np.float64)
+        self.sigmas = np.empty(0, dtype=np.float64)
+        self.matches = 0
+        self.batches = 0
+
+    def feed(self, matches: Sequence[Tuple[Hashable, Hashable]]) -> None:
+        """Rate next matches, in the order they were played"""
+        winners = self._indexes(winner for winner, _ in matches)
+        losers = self._indexes(loser for _, loser in matches)
+        self._grow()
+        self.mus, self.sigmas, batches = rate_matches(self.mus, self.sigmas, winners, losers, self.env)
+        self.matches += len(matches)
+        self.batches += batches
+
+    def replay(self, chunks: Iterable[Sequence[Tuple[Hashable, Hashable]]]) -> "HistoryReplay":
+        for chunk in chunks:
+            self.feed(chunk)
+        return self
+
+    def ratings(self) -> Iterator[Tuple[Hashable, float, float]]:
+        """(player, mu, sigma) of every player"""
+        return zip(self.players, self.mus.tolist(), self.sigmas.tolist())
+
+    def _indexes(self, players: Iterable[Hashable]) -> np.ndarray:
+        index = self.players
+        return np.fromiter((index.setdefault(player, len(index)) for player in players), dtype=np.intp)
+
+    def _grow(self) -> None:
+        new = len(self.players) - self.mus.size
+        if new:
+            self.mus = np.concatenate([self.mus, np.full(new, self.env.mu)])
+            self.sigmas = np.concatenate([self.sigmas, np.full(new, self.env.sigma)])
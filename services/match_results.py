@@ -0,0 +1,93 @@
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from django.db import transaction
+from trueskill import TrueSkill
+
+from services.leaderboard import leaderboard
+from services.rating import independent_batches, rate_1vs1
+from services.rating_writer import rating_writer
+
+
+class UnknownPlayersError(ValueError):
+    def __init__(self, users_uuids: Sequence[str]):
+        super().__init__(f"Unknown players: {', '.join(sorted(users_uuids))}")
+        self.users_uuids = users_uuids
+
+
+def rate_matches(
+    mus: np.ndarray,
+    sigmas: np.ndarray,
+    winners: np.ndarray,
+    losers: np.ndarray,
+    env: Optional[TrueSkill] = None,
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Rate 1 vs 1 matches in the order they were played
+
+    :param mus: mu of every player
+    :param sigmas: sigma of every player
+    :param winners: index of winner in ``mus`` for every match
+    :param losers: index of loser in ``mus`` for every match
+    :param env: trueskill environment, global one by default
+    :return: (new mus, new sigmas, how many vectorized batches were rated)
+    """
+    mus, sigmas = mus.copy(), sigmas.copy()
+    batches = independent_batches(list(zip(winners.tolist(), losers.tolist())))
+    for batch in batches:
+        winner, loser = winners[batch], losers[batch]
+        mus[winner], sigmas[winner], mus[loser], sigmas[loser] = rate_1vs1(
+            mus[winner], sigmas[winner], mus[loser], sigmas[loser], env
+        )
+    return mus, sigmas, len(batches)
+
+
+def ingest_results(results: Sequence[Tuple[str, str]]) -> Dict[str, float]:
+    """
+    Rate and save many finished matches in one transaction
+
+    :param results: (winner uuid, loser uuid) for every match, in the order matches were played
+    :return: report with counts and throughput
+    """
+    from game_auth.models import Match, User
+
+    started = time.perf_counter()
+    players = list(dict.fromkeys(user_uuid for match in results for user_uuid in match))
+    index = {user_uuid: position for position, user_uuid in enumerate(players)}
+    winners = np.array([index[winner] for winner, _ in results], dtype=np.intp)
+    losers = np.array([index[loser] for _, loser in results], dtype=np.intp)
+
+    pending = rating_writer.take(players)
+    try:
+        with transaction.atomic():
+            users = {str(user.uuid): user for user in User.objects.select_for_update().filter(uuid__in=players)}
+            missing = set(players) - set(users)
+            if missing:
+                raise UnknownPlayersError(list(missing))
+            users = [users[user_uuid] for user_uuid in players]
+            for user_uuid, user in zip(players, users):
+                user.mu, user.sigma = pending.get(user_uuid, (user.mu, user.sigma))
+            mus = np.array([user.mu for user in users], dtype=np.float64)
+            sigmas = np.array([user.sigma for user in users], dtype=np.float64)
+
+            mus, sigmas, batches = rate_matches(mus, sigmas, winners, losers)
+            for user, mu, sigma in zip(users, mus.tolist(), sigmas.tolist()):
+                user.mu, user.sigma = mu, sigma
+            User.objects.bulk_update(users, fields=["mu", "sigma"], batch_size=1000)
+            Match.objects.bulk_create(
+                [Match(winner=winner, loser=loser) for winner, loser in results], batch_size=1000
+            )
+    except Exception:
+        rating_writer.restore(pending)
+        raise
+    leaderboard.update({str(user.uuid): user.rating for user in users})
+
+    seconds = time.perf_counter() - started
+    return {
+        "matches": len(results),
+        "players": len(players),
+        "batches": batches,
+        "seconds": seconds,
+        "matches_per_second": len(results) / seconds if seconds else 0.0,
+    }
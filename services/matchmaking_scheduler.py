@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from game_auth.models import User
+
+from conf.settings import (
+    MATCHMAKING_BATCH_SIZE,
+    MATCHMAKING_DEFAULT_MODE,
+    MATCHMAKING_ENTRY_TTL,
+    MATCHMAKING_PAIRING_MODE,
+    MATCHMAKING_PROCESS_COUNT,
+    MATCHMAKING_PROCESS_INDEX,
+    MATCHMAKING_SWEEP_INTERVAL,
+    MATCHMAKING_TICK_INTERVAL,
+    MATCHMAKING_WINDOW_LIMIT,
+)
+from services.metrics import counter, gauge, histogram, timed
+from services.pairing import PAIRING_MODES
+from services.redis_hash import AsyncRedisHMapMatchmakingStorage
+from services.sharding import ShardedQueue, queue
+from services.tasks import service_tasks
+from services.user_matchmaking import MM, compute_pool
+
+# returns None once the match started, else uuids of users who must wait again, e.g. because their enemy left
+OnMatch = Callable[[str, str], Awaitable[Optional[Sequence[str]]]]
+
+logger = logging.getLogger(__name__)
+
+queue_depth = gauge("matchmaking_queue_depth", "Users waiting for a match", labels=("shard",))
+matches_total = counter("matchmaking_matches_total", "Pairs taken out of the queue")
+time_to_match = histogram(
+    "matchmaking_time_to_match_seconds",
+    "Seconds from joining the queue to a match",
+    buckets=(1, 2, 5, 10, 20, 30, 60, 120),
+)
+search_times_at_match = histogram(
+    "matchmaking_search_times",
+    "Ticks users waited, how far their threshold relaxed",
+    buckets=(0, 1, 2, 5, 10, 20, 30, 50),
+)
+swept_total = counter("matchmaking_swept_total", "Users removed from the queue as not seen", labels=("shard",))
+notify_errors_total = counter("matchmaking_notify_errors_total", "Matched pairs whose users were not notified")
+scheduler_errors_total = counter(
+    "matchmaking_scheduler_errors_total", "Matchmaking rounds failed with an exception", labels=("shard",)
+)
+tick_seconds = histogram("matchmaking_tick_seconds", "Duration of one matchmaking round")
+
+
+class MatchmakingScheduler:
+    """
+    One matchmaking engine per queue.
+
+    Every tick the longest waiting users are paired in a single pass,
+    instead of every waiting User polling and scoring the whole queue every second.
+    Enemies are fetched from the rating index, only inside the mu window
+    where match probability can be above threshold, and pairs are chosen
+    by one of ``services.pairing.PAIRING_MODES``.
+    Users not seen for ``entry_ttl`` seconds are swept out of the queue every ``sweep_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        storage: AsyncRedisHMapMatchmakingStorage,
+        tick_interval: float = MATCHMAKING_TICK_INTERVAL,
+        batch_size: int = MATCHMAKING_BATCH_SIZE,
+        window_limit: int = MATCHMAKING_WINDOW_LIMIT,
+        mode: str = MATCHMAKING_PAIRING_MODE,
+        on_match: Optional[OnMatch] = None,
+        keep_running: bool = False,
+        entry_ttl: float = MATCHMAKING_ENTRY_TTL,
+        sweep_interval: float = MATCHMAKING_SWEEP_INTERVAL,
+    ):
+        self.storage = storage
+        self.tick_interval = tick_interval
+        self.batch_size = batch_size
+        self.window_limit = window_limit
+        self.mode = mode
+        self.on_match = on_match
+        self.keep_running = keep_running
+        self.entry_ttl = entry_ttl
+        self.sweep_interval = sweep_interval
+        self._swept_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def join(self, user: "User") -> bool:
+        """Put User in queue and wake up scheduler. Returns False if User already waits"""
+        was_added = await self.storage.add_if_not_exists(user)
+        if was_added:
+            self.ensure_running()
+        return was_added
+
+    def ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = service_tasks.start("matchmaking_scheduler", self.run())
+
+    async def run(self) -> None:
+        """Tick until queue is empty, or forever with ``keep_running``. Failed ticks are logged and retried"""
+        while True:
+            try:
+                if not await self.tick() and not self.keep_running:
+                    return
+            except Exception:
+                scheduler_errors_total.labels(self.storage.name).inc()
+                logger.exception("Matchmaking round of %s failed", self.storage.name)
+            await asyncio.sleep(self.tick_interval)
+
+    @timed(tick_seconds)
+    async def tick(self) -> int:
+        """
+        Pair longest waiting users with enemies from their mu windows and notify them
+
+        :return: int how many users still wait
+        """
+        now = time.time()
+        await self.sweep(now)
+        batch = await self.storage.oldest(self.batch_size)
+        pairs = await self.pair(batch, now) if batch else []
+        claimed = await self.storage.claim_pairs(pairs)
+        for (user, enemy), is_claimed in zip(pairs, claimed):
+            if is_claimed:
+                await self.notify(user, enemy, now)
+        waiting = await self.storage.length()
+        queue_depth.labels(self.storage.name).set(waiting)
+        return waiting
+
+    async def notify(self, user: dict, enemy: dict, now: float) -> None:
+        """
+        Call ``on_match`` for claimed pair, its errors don't stop matchmaking of other pairs.
+        If the match is not started, users ``on_match`` returns, or both users if it failed,
+        are put back in the queue, still waiting since they joined.
+        """
+        try:
+            waiting = await self.on_match(user["uuid"], enemy["uuid"])
+        except Exception:
+            notify_errors_total.inc()
+            logger.exception("Match of %s and %s was claimed, but not started", user["uuid"], enemy["uuid"])
+            waiting = [user["uuid"], enemy["uuid"]]
+        if waiting is None:
+            self.observe_match(user, enemy, now)
+        else:
+            await self.storage.put_back([player for player in (user, enemy) if player["uuid"] in waiting])
+
+    async def sweep(self, now: float) -> int:
+        """Remove users not seen for ``entry_ttl`` seconds, at most once per ``sweep_interval``"""
+        if now - self._swept_at < self.sweep_interval:
+            return 0
+        self._swept_at = now
+        swept = await self.storage.sweep(now - self.entry_ttl)
+        swept_total.labels(self.storage.name).inc(swept)
+        return swept
+
+    async def pair(self, batch: List[dict], now: float) -> List[Tuple[dict, dict]]:
+        """Pair longest waiting users and enemies from their mu windows with configured pairing mode"""
+        windows = [
+            (user["mu"], *MM.get_mu_window(user["mu"], user["sigma"], MM.get_threshold(self.search_times(user, now))))
+            for user in batch
+        ]
+        candidates = await self.storage.windows(windows, self.window_limit)
+        search_times = {
+            user["uuid"]: self.search_times(user, now) for enemies in (batch, *candidates) for user in enemies
+        }
+        return await compute_pool.run(PAIRING_MODES[self.mode], batch, candidates, search_times)
+
+    def observe_match(self, user: dict, enemy: dict, now: float) -> None:
+        matches_total.inc()
+        for player in (user, enemy):
+            time_to_match.observe(now - player.get("joined_at", now))
+            search_times_at_match.observe(self.search_times(player, now))
+
+    def search_times(self, user: dict, now: float) -> int:
+        """How many ticks User already waits"""
+        return int((now - user.get("joined_at", now)) // self.tick_interval)
+
+
+class ShardedScheduler:
+    """
+    Schedulers of the queue shards owned by this process.
+
+    With one process every shard is matched here and its scheduler is woken up by joins.
+    With many processes users join shards of other processes too,
+    so owned schedulers keep polling their shards once started.
+    ``start`` them at process startup, users may already wait from before a restart.
+    """
+
+    def __init__(
+        self,
+        queue: ShardedQueue,
+        process_index: int = MATCHMAKING_PROCESS_INDEX,
+        process_count: int = MATCHMAKING_PROCESS_COUNT,
+    ):
+        self.queue = queue
+        self.process_count = process_count
+        self.schedulers: Dict[str, MatchmakingScheduler] = {
+            shard.name: MatchmakingScheduler(shard, keep_running=process_count > 1)
+            for shard in queue.owned(process_index, process_count)
+        }
+        self._on_match: Optional[OnMatch] = None
+
+    @property
+    def on_match(self) -> Optional[OnMatch]:
+        return self._on_match
+
+    @on_match.setter
+    def on_match(self, on_match: OnMatch) -> None:
+        self._on_match = on_match
+        for scheduler in self.schedulers.values():
+            scheduler.on_match = on_match
+
+    async def join(self, user: "User", mode: str = MATCHMAKING_DEFAULT_MODE) -> bool:
+        """Put User in their shard. Returns False if User already waits, raises KeyError for unknown mode"""
+        shard = await self.queue.add_if_not_exists(user, mode)
+        if shard is None:
+            return False
+        self.ensure_running(shard.name)
+        return True
+
+    async def leave(self, user_uuid: str) -> None:
+        await self.queue.remove(user_uuid)
+
+    def start(self) -> None:
+        """Run schedulers of all owned shards"""
+        for scheduler in self.schedulers.values():
+            scheduler.ensure_running()
+
+    def ensure_running(self, shard_name: str) -> None:
+        if self.process_count > 1:
+            self.start()
+        elif shard_name in self.schedulers:
+            self.schedulers[shard_name].ensure_running()
+
+
+scheduler = ShardedScheduler(queue)
@@ -0,0 +1,239 @@
+"""
+Process metrics exposed in Prometheus text format.
+
+Metrics are module level objects made by ``counter``, ``gauge`` and ``histogram``.
+With ``METRICS_ENABLED`` off every one of them is the same no-op object
+and ``timed`` returns the decorated function itself, so hot paths pay nothing.
+"""
+import asyncio
+import bisect
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+
+from conf.settings import METRICS_ENABLED
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Key = Tuple[str, ...]
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[Key, float] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str) -> "Labeled":
+        return Labeled(self, tuple(str(value) for value in values))
+
+    def samples(self) -> Iterator[Tuple[str, Key, float]]:
+        """(suffix, label values, value) of every time series"""
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", key, value
+
+    def _add(self, key: Key, amount: float) -> None:
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, key: Key = ()) -> None:
+        self._add(key, amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, key: Key = ()) -> None:
+        self._add(key, amount)
+
+    def dec(self, amount: float = 1, key: Key = ()) -> None:
+        self._add(key, -amount)
+
+    def set(self, value: float, key: Key = ()) -> None:  # noqa: A003
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # counts of every bucket, not cumulative, then +Inf, sum
+        self._observed: Dict[Key, List[float]] = {}
+
+    def observe(self, value: float, key: Key = ()) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            observed = self._observed.get(key)
+            if observed is None:
+                observed = self._observed[key] = [0.0] * (len(self.buckets) + 2)
+            observed[index] += 1
+            observed[-1] += value
+
+    @contextmanager
+    def time(self, key: Key = ()) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, key)
+
+    def samples(self) -> Iterator[Tuple[str, Key, float]]:
+        with self._lock:
+            observed = {key: list(counts) for key, counts in self._observed.items()}
+        for key, counts in observed.items():
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                yield "_bucket", (*key, _format(bound)), cumulative
+            yield "_sum", key, counts[-1]
+            yield "_count", key, cumulative
+
+
+class Labeled:
+    """Time series of metric with label values"""
+
+    def __init__(self, metric: Metric, key: Key):
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount: float = 1) -> None:
+        self.metric.inc(amount, self.key)
+
+    def dec(self, amount: float = 1) -> None:
+        self.metric.dec(amount, self.key)
+
+    def set(self, value: float) -> None:  # noqa: A003
+        self.metric.set(value, self.key)
+
+    def observe(self, value: float) -> None:
+        self.metric.observe(value, self.key)
+
+    def time(self):
+        return self.metric.time(self.key)
+
+
+class NullMetric:
+    """Metric of disabled metrics"""
+
+    def labels(self, *_values: str) -> "NullMetric":
+        return self
+
+    def inc(self, *_args) -> None:
+        pass
+
+    def dec(self, *_args) -> None:
+        pass
+
+    def set(self, *_args) -> None:  # noqa: A003
+        pass
+
+    def observe(self, *_args) -> None:
+        pass
+
+    def time(self, *_args):
+        return nullcontext()
+
+
+NULL_METRIC = NullMetric()
+REGISTRY: List[Metric] = []
+
+AnyMetric = Union[Metric, NullMetric]
+
+
+def _register(metric: Metric) -> AnyMetric:
+    if not METRICS_ENABLED:
+        return NULL_METRIC
+    REGISTRY.append(metric)
+    return metric
+
+
+def counter(name: str, documentation: str, labels: Sequence[str] = ()) -> AnyMetric:
+    return _register(Counter(name, documentation, labels))
+
+
+def gauge(name: str, documentation: str, labels: Sequence[str] = ()) -> AnyMetric:
+    return _register(Gauge(name, documentation, labels))
+
+
+def histogram(
+    name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+) -> AnyMetric:
+    return _register(Histogram(name, documentation, labels, buckets))
+
+
+def timed(metric: AnyMetric, *label_values: str) -> Callable[[Callable], Callable]:
+    """Observe duration of every call of sync or async function, nothing at all when metrics are off"""
+
+    def decorator(func: Callable) -> Callable:
+        if isinstance(metric, NullMetric):
+            return func
+        series = metric.labels(*label_values)
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with series.time():
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with series.time():
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def render(metrics: Iterable[Metric] = REGISTRY) -> str:
+    """Prometheus text exposition format"""
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        label_names = metric.label_names
+        for suffix, key, value in metric.samples():
+            names = (*label_names, "le") if suffix == "_bucket" else label_names
+            lines.append(f"{metric.name}{suffix}{_labels(names, key)} {_format(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(names: Sequence[str], values: Key) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return f"{{{pairs}}}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return str(int(value)) if value.is_integer() else repr(value)
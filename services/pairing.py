@@ -0,0 +1,135 @@
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from services.quality import quality_1vs1
+from services.user_matchmaking import MM
+
+GREEDY = "greedy"
+WINDOWED_GREEDY = "windowed_greedy"
+OPTIMAL = "optimal"
+
+Pairs = List[Tuple[dict, dict]]
+
+
+def pair_greedy(batch: Sequence[dict], candidates: Sequence[Sequence[dict]], search_times: Dict[str, int]) -> Pairs:
+    """Longest waiting users search first and take the first enemy above their threshold"""
+    paired = set()
+    pairs = []
+    for user, enemies in zip(batch, candidates):
+        if user["uuid"] in paired:
+            continue
+        enemies = (enemy for enemy in enemies if enemy["uuid"] not in paired)
+        enemy = MM.find_enemy(user, search_times[user["uuid"]], enemies)
+        if enemy is not None:
+            paired.update((user["uuid"], enemy["uuid"]))
+            pairs.append((user, enemy))
+    return pairs
+
+
+def pair_windowed_greedy(
+    batch: Sequence[dict], candidates: Sequence[Sequence[dict]], search_times: Dict[str, int]
+) -> Pairs:
+    """Best quality pairs first, among every user and enemies from their mu window"""
+    edges = []
+    for user, enemies in zip(batch, candidates):
+        enemies = [enemy for enemy in enemies if enemy["uuid"] != user["uuid"]]
+        if not enemies:
+            continue
+        probs = MM.get_match_probabilities(user, enemies)
+        thresholds = _thresholds(enemies, search_times, at_most=MM.get_threshold(search_times[user["uuid"]]))
+        edges.extend((prob, user, enemies[index]) for index, prob in _above(probs, thresholds))
+
+    edges.sort(key=lambda edge: edge[0], reverse=True)
+    paired = set()
+    pairs = []
+    for _, user, enemy in edges:
+        if user["uuid"] not in paired and enemy["uuid"] not in paired:
+            paired.update((user["uuid"], enemy["uuid"]))
+            pairs.append((user, enemy))
+    return pairs
+
+
+def pair_optimal(
+    batch: Sequence[dict], candidates: Sequence[Sequence[dict]], search_times: Dict[str, int], reach: int = 3
+) -> Pairs:
+    """
+    Sorted sweep: users are ordered by mu and only users at most ``reach`` positions apart can be paired.
+    Among all such pairings, nested and interleaved pairs included, the one with the most pairs,
+    then the best total quality, is found exactly by dynamic programming in O(n * reach * 2 ** reach).
+    """
+    players = {user["uuid"]: user for enemies in (batch, *candidates) for user in enemies}
+    players = sorted(players.values(), key=lambda user: user["mu"])
+    mus = np.array([user["mu"] for user in players], dtype=np.float64)
+    sigmas = np.array([user["sigma"] for user in players], dtype=np.float64)
+    thresholds = _thresholds(players, search_times)
+
+    # weights[k][i] - weight of pair (i, i + k), a pair outweighs better total quality of fewer pairs
+    weights = [None]
+    for k in range(1, reach + 1):
+        probs = quality_1vs1(mus[:-k], sigmas[:-k], mus[k:], sigmas[k:])
+        allowed = probs > np.minimum(thresholds[:-k], thresholds[k:])
+        weights.append(np.where(allowed, len(players) + probs, -np.inf).tolist())
+
+    return [(players[i], players[j]) for i, j in _best_matching(weights, len(players), reach)]
+
+
+def _best_matching(weights: List[List[float]], size: int, reach: int) -> List[Tuple[int, int]]:
+    """
+    Max weight pairs of users at most ``reach`` positions apart, users are added one by one.
+    State is a bit mask of the last ``reach`` users still unpaired, bit b - user ``i - 1 - b``,
+    ``steps[i][mask]`` - previous state and how far back user ``i`` is paired, 0 if unpaired.
+    """
+    best = {0: 0.0}
+    steps = []
+    for i in range(size):
+        best, step = _add_user(best, weights, i, reach)
+        steps.append(step)
+
+    pairs = []
+    mask = max(best, key=best.get) if best else 0
+    for i in reversed(range(size)):
+        mask, k = steps[i][mask]
+        if k:
+            pairs.append((i - k, i))
+    return pairs
+
+
+def _add_user(
+    best: Dict[int, float], weights: List[List[float]], i: int, reach: int
+) -> Tuple[Dict[int, float], Dict[int, Tuple[int, int]]]:
+    """Best weight of every state after user ``i`` and its previous state with ``k``"""
+    next_best, step = {}, {}
+    for mask, value in best.items():
+        for next_mask, weight, k in _transitions(weights, mask, i, reach):
+            if value + weight > next_best.get(next_mask, -np.inf):
+                next_best[next_mask], step[next_mask] = value + weight, (mask, k)
+    return next_best, step
+
+
+def _transitions(weights: List[List[float]], mask: int, i: int, reach: int):
+    """(next mask, weight, k) for user ``i`` left unpaired or paired with unpaired user ``i - k``"""
+    full = (1 << reach) - 1
+    yield (mask << 1 | 1) & full, 0.0, 0
+    for k in range(1, min(reach, i) + 1):
+        weight = weights[k][i - k]
+        if mask >> (k - 1) & 1 and weight > -np.inf:
+            yield (mask & ~(1 << (k - 1))) << 1 & full, weight, k
+
+
+PAIRING_MODES: Dict[str, Callable[..., Pairs]] = {
+    GREEDY: pair_greedy,
+    WINDOWED_GREEDY: pair_windowed_greedy,
+    OPTIMAL: pair_optimal,
+}
+
+
+def _thresholds(users: Sequence[dict], search_times: Dict[str, int], at_most: float = np.inf) -> np.ndarray:
+    """Pair is allowed when quality is above the lower threshold of its two users"""
+    times = np.array([search_times[user["uuid"]] for user in users], dtype=np.float64)
+    return np.minimum(MM.get_threshold(times), at_most)
+
+
+def _above(probs: np.ndarray, thresholds: np.ndarray):
+    indexes = np.flatnonzero(probs > thresholds)
+    return zip(indexes.tolist(), probs[indexes].tolist())
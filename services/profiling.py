@@ -0,0 +1,153 @@
+"""
+Sampled per-message profiling.
+
+One in ``sample_rate`` websocket messages is traced: time spent in every section
+(DB, Redis, channel layer, serialization) is added to the trace of the message.
+Traced messages slower than ``slow_seconds`` are logged with their breakdown,
+totals per message type can be dumped to a JSON file.
+With ``PROFILING_SAMPLE_RATE = 0`` sections cost nothing, ``profiled`` returns the function itself.
+"""
+import asyncio
+import atexit
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, Optional
+
+from conf.settings import PROFILING_DUMP_PATH, PROFILING_SAMPLE_RATE, PROFILING_SLOW_SECONDS
+
+DB = "db"
+REDIS = "redis"
+CHANNEL_LAYER = "channel_layer"
+SERIALIZATION = "serialization"
+OTHER = "other"
+
+logger = logging.getLogger(__name__)
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.sections: Dict[str, float] = {}
+        self.finished = False
+
+    def add(self, section: str, seconds: float) -> None:
+        # tasks started while handling the message inherit its trace, they must not change it later
+        if not self.finished:
+            self.sections[section] = self.sections.get(section, 0.0) + seconds
+
+    def finish(self) -> None:
+        self.finished = True
+        self.seconds = time.perf_counter() - self.started
+        self.sections[OTHER] = max(self.seconds - sum(self.sections.values()), 0.0)
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("profiling_trace", default=None)
+
+
+class Profiler:
+    def __init__(
+        self,
+        sample_rate: int = PROFILING_SAMPLE_RATE,
+        slow_seconds: float = PROFILING_SLOW_SECONDS,
+    ):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self._seen = 0
+        self._totals: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    @contextmanager
+    def message(self, name: str = "unknown") -> Iterator[Optional[Trace]]:
+        """Trace this message if it is sampled, yields the trace or None"""
+        self._seen += 1
+        if not self.enabled or self._seen % self.sample_rate:
+            yield None
+            return
+        trace = Trace(name)
+        token = _trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _trace.reset(token)
+            trace.finish()
+            self.record(trace)
+
+    def rename(self, name: str) -> None:
+        """Name the trace of current message, e.g. once its type is known"""
+        trace = _trace.get()
+        if trace is not None:
+            trace.name = name
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        """Add time of the block to the trace of current message, if it is traced"""
+        trace = _trace.get()
+        if trace is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            trace.add(name, time.perf_counter() - started)
+
+    def record(self, trace: Trace) -> None:
+        with self._lock:
+            totals = self._totals.setdefault(trace.name, {"count": 0, "seconds": 0.0})
+            totals["count"] += 1
+            totals["seconds"] += trace.seconds
+            for section, seconds in trace.sections.items():
+                totals[section] = totals.get(section, 0.0) + seconds
+        if trace.seconds > self.slow_seconds:
+            breakdown = ", ".join(f"{section}={seconds:.4f}s" for section, seconds in trace.sections.items())
+            logger.warning("Slow handler %s took %.4fs: %s", trace.name, trace.seconds, breakdown)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Totals of traced messages per message type"""
+        with self._lock:
+            return {name: dict(totals) for name, totals in self._totals.items()}
+
+    def dump(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump({"sample_rate": self.sample_rate, "messages": self.stats()}, file, indent=2)
+
+
+profiler = Profiler()
+if profiler.enabled and PROFILING_DUMP_PATH:
+    atexit.register(profiler.dump, PROFILING_DUMP_PATH)
+
+
+def profiled(section: str) -> Callable[[Callable], Callable]:
+    """Add time of every call of sync or async function to the trace of current message"""
+
+    def decorator(func: Callable) -> Callable:
+        if not profiler.enabled:
+            return func
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with profiler.section(section):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profiler.section(section):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
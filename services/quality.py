@@ -0,0 +1,39 @@
+"""
+Vectorized 1 vs 1 match quality.
+
+Closed form of ``trueskill.quality`` for two teams of one player::
+
+    c2 = 2 * beta^2 + sigma_a^2 + sigma_b^2
+    quality = sqrt(2 * beta^2 / c2) * exp(-(mu_a - mu_b)^2 / (2 * c2))
+"""
+from typing import Optional
+
+import numpy as np
+from numpy.typing import ArrayLike
+from trueskill import global_env
+
+
+def quality_1vs1(
+    mu_a: ArrayLike, sigma_a: ArrayLike, mu_b: ArrayLike, sigma_b: ArrayLike, beta: Optional[float] = None
+) -> np.ndarray:
+    """Element-wise match quality, arguments are broadcast against each other"""
+    if beta is None:
+        beta = global_env().beta
+    mu_a, sigma_a, mu_b, sigma_b = (np.asarray(x, dtype=np.float64) for x in (mu_a, sigma_a, mu_b, sigma_b))
+    double_beta_square = 2 * beta ** 2
+    c2 = double_beta_square + sigma_a ** 2 + sigma_b ** 2
+    return np.sqrt(double_beta_square / c2) * np.exp(-((mu_a - mu_b) ** 2) / (2 * c2))
+
+
+def quality_vector(
+    mu: float, sigma: float, mus: ArrayLike, sigmas: ArrayLike, beta: Optional[float] = None
+) -> np.ndarray:
+    """Match quality of one player against many: shape (n,)"""
+    return quality_1vs1(mu, sigma, mus, sigmas, beta)
+
+
+def quality_matrix(mus: ArrayLike, sigmas: ArrayLike, beta: Optional[float] = None) -> np.ndarray:
+    """Pairwise match quality of all players: shape (n, n)"""
+    mus = np.asarray(mus, dtype=np.float64)
+    sigmas = np.asarray(sigmas, dtype=np.float64)
+    return quality_1vs1(mus[:, None], sigmas[:, None], mus[None, :], sigmas[None, :], beta)
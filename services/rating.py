@@ -0,0 +1,109 @@
+"""
+Vectorized 1 vs 1 TrueSkill update.
+
+For two teams of one player the factor graph of ``trueskill.rate`` reduces to::
+
+    sigma^2 += tau^2
+    c = sqrt(2 * beta^2 + winner_sigma^2 + loser_sigma^2)
+    t = (winner_mu - loser_mu) / c,  e = draw_margin / c
+    v = pdf(t - e) / cdf(t - e),  w = v * (v + t - e)
+    winner_mu += winner_sigma^2 / c * v,  loser_mu -= loser_sigma^2 / c * v
+    sigma^2 *= 1 - sigma^2 / c^2 * w
+"""
+import math
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.typing import ArrayLike
+from trueskill import TrueSkill, calc_draw_margin, global_env
+
+Ratings = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+# Chebyshev fit of erfc used by trueskill (Numerical Recipes ``erfcc``)
+ERFC_COEFFICIENTS = (
+    -1.26551223,
+    1.00002368,
+    0.37409196,
+    0.09678418,
+    -0.18628806,
+    0.27886807,
+    -1.13520398,
+    1.48851587,
+    -0.82215223,
+    0.17087277,
+)
+
+
+def erfc(x: np.ndarray) -> np.ndarray:
+    """Complementary error function, same approximation as ``trueskill.backends.erfc``"""
+    z = np.abs(x)
+    t = 1.0 / (1.0 + z / 2.0)
+    polynomial = ERFC_COEFFICIENTS[-1]
+    for coefficient in ERFC_COEFFICIENTS[-2:0:-1]:
+        polynomial = coefficient + t * polynomial
+    r = t * np.exp(-z * z + ERFC_COEFFICIENTS[0] + t * polynomial)
+    return np.where(x < 0, 2.0 - r, r)
+
+
+def cdf(x: np.ndarray) -> np.ndarray:
+    return 0.5 * erfc(-x / math.sqrt(2))
+
+
+def pdf(x: np.ndarray) -> np.ndarray:
+    return np.exp(-(x ** 2) / 2) / math.sqrt(2 * math.pi)
+
+
+def rate_1vs1(
+    winner_mu: ArrayLike,
+    winner_sigma: ArrayLike,
+    loser_mu: ArrayLike,
+    loser_sigma: ArrayLike,
+    env: Optional[TrueSkill] = None,
+) -> Ratings:
+    """
+    New ratings after winners beat losers, element-wise for arrays of matches
+
+    :return: (winner_mu, winner_sigma, loser_mu, loser_sigma)
+    """
+    if env is None:
+        env = global_env()
+    winner_mu, winner_sigma, loser_mu, loser_sigma = (
+        np.asarray(x, dtype=np.float64) for x in (winner_mu, winner_sigma, loser_mu, loser_sigma)
+    )
+    winner_var = winner_sigma ** 2 + env.tau ** 2
+    loser_var = loser_sigma ** 2 + env.tau ** 2
+    c2 = 2 * env.beta ** 2 + winner_var + loser_var
+    c = np.sqrt(c2)
+
+    x = (winner_mu - loser_mu - calc_draw_margin(env.draw_probability, 2, env)) / c
+    denom = cdf(x)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        v = np.where(denom > 0, pdf(x) / denom, -x)
+    w = np.clip(v * (v + x), 0, 1)
+
+    new_winner_mu = winner_mu + winner_var / c * v
+    new_loser_mu = loser_mu - loser_var / c * v
+    new_winner_sigma = np.sqrt(winner_var * (1 - winner_var / c2 * w))
+    new_loser_sigma = np.sqrt(loser_var * (1 - loser_var / c2 * w))
+    return new_winner_mu, new_winner_sigma, new_loser_mu, new_loser_sigma
+
+
+def independent_batches(matches: Sequence[Sequence[Hashable]]) -> List[List[int]]:
+    """
+    Split matches into batches where no player plays twice, keeping order of every player's matches:
+    a match goes to the batch after the last one where any of its players played.
+
+    :param matches: players of every match, in the order matches were played
+    :return: indexes of matches for every batch, batches are rated one after another
+    """
+    last_batch: Dict[Hashable, int] = {}
+    batches: List[List[int]] = []
+    for index, players in enumerate(matches):
+        batch = max((last_batch.get(player, -1) for player in players), default=-1) + 1
+        if batch == len(batches):
+            batches.append([])
+        batches[batch].append(index)
+        for player in players:
+            last_batch[player] = batch
+    return batches
@@ -0,0 +1,58 @@
+import atexit
+from typing import Dict, Iterable, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from game_auth.models import User
+
+from conf.settings import RATING_FLUSH_INTERVAL, RATING_FLUSH_SIZE
+from services.write_behind import WriteBehind
+
+
+class RatingWriteBehind(WriteBehind):
+    """
+    New mu and sigma of users are collected in memory and saved with one ``bulk_update``
+    once ``flush_size`` users are pending or ``flush_interval`` seconds passed.
+    Repeated updates of one User are collapsed into the latest one.
+    Pending values are seen only in this process, see RATING_FLUSH_INTERVAL.
+    """
+
+    task_name = "rating_writer"
+
+    def __init__(self, flush_size: int = RATING_FLUSH_SIZE, flush_interval: float = RATING_FLUSH_INTERVAL):
+        super().__init__(flush_size, flush_interval)
+
+    def add(self, user: "User") -> None:
+        with self._lock:
+            self._pending[str(user.uuid)] = (user.mu, user.sigma)
+        self.flush_if_due()
+
+    def apply(self, users: Iterable["User"]) -> None:
+        """Set not yet saved mu and sigma on users loaded from DB"""
+        for user in users:
+            mu_sigma = self._pending.get(str(user.uuid))
+            if mu_sigma is not None:
+                user.mu, user.sigma = mu_sigma
+
+    def take(self, users_uuids: Iterable[str]) -> Dict[str, Tuple[float, float]]:
+        """Stop tracking users whose ratings are about to be saved by someone else"""
+        with self._lock:
+            return {user_uuid: self._pending.pop(user_uuid) for user_uuid in users_uuids if user_uuid in self._pending}
+
+    def restore(self, pending: Dict[str, Tuple[float, float]]) -> None:
+        """Put back values which were not saved, newer updates win"""
+        with self._lock:
+            self._pending = {**pending, **self._pending}
+
+    def _empty(self) -> Dict[str, Tuple[float, float]]:
+        return {}
+
+    def _save(self, pending: Dict[str, Tuple[float, float]]) -> int:
+        from game_auth.models import User
+
+        users = [User(uuid=user_uuid, mu=mu, sigma=sigma) for user_uuid, (mu, sigma) in pending.items()]
+        User.objects.bulk_update(users, fields=["mu", "sigma"], batch_size=self.flush_size)
+        return len(users)
+
+
+rating_writer = RatingWriteBehind()
+atexit.register(rating_writer.flush)
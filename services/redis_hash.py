@@ -1,19 +1,107 @@
 import json
-from typing import Union, Iterable, Sequence, TYPE_CHECKING
+import time
+from typing import Callable, Dict, Union, Iterable, List, Optional, Sequence, Tuple, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from game_auth.models import User
 
-import redis
+from conf.settings import MATCHMAKING_PAIR_TTL
+from services.metrics import timed
+from services.profiling import REDIS, profiled
+from services.redis_pool import get_redis, get_sync_redis, redis_operation_seconds, run_script
 
-from conf.settings import REDIS_HOST, REDIS_PORT
+
+# KEYS: queue hash, mu index, joined index, seen index of every shard taking part, one shard after another
+# ARGV: pair key prefix, pair ttl, then for every pair: user uuid, user shard, enemy uuid, enemy shard,
+#       where shard is the position of shard's queue hash in KEYS
+# Pair is claimed only if both users are still queued: they are removed from their shards
+# and "{prefix}{uuid} -> enemy uuid" is recorded for both. Returns 1 or 0 for every pair.
+CLAIM_PAIRS_SCRIPT = """
+local claimed = {}
+for i = 3, #ARGV, 4 do
+    local user, user_shard, enemy, enemy_shard = ARGV[i], tonumber(ARGV[i + 1]), ARGV[i + 2], tonumber(ARGV[i + 3])
+    if redis.call("HEXISTS", KEYS[user_shard], user) == 1 and redis.call("HEXISTS", KEYS[enemy_shard], enemy) == 1 then
+        for _, queued in ipairs({{user, user_shard}, {enemy, enemy_shard}}) do
+            redis.call("HDEL", KEYS[queued[2]], queued[1])
+            for index = 1, 3 do
+                redis.call("ZREM", KEYS[queued[2] + index], queued[1])
+            end
+        end
+        redis.call("SET", ARGV[1] .. user, enemy, "EX", ARGV[2])
+        redis.call("SET", ARGV[1] .. enemy, user, "EX", ARGV[2])
+        claimed[#claimed + 1] = 1
+    else
+        claimed[#claimed + 1] = 0
+    end
+end
+return claimed
+"""
+
+# KEYS: queue hash, mu index, joined index, seen index
+# ARGV: cutoff, limit
+# Removes at most ``limit`` users last seen before cutoff, returns how many were removed
+SWEEP_SCRIPT = """
+local stale = redis.call("ZRANGEBYSCORE", KEYS[4], "-inf", ARGV[1], "LIMIT", 0, ARGV[2])
+for _, user in ipairs(stale) do
+    redis.call("HDEL", KEYS[1], user)
+    for index = 2, 4 do
+        redis.call("ZREM", KEYS[index], user)
+    end
+end
+return #stale
+"""
+
+# KEYS: the hash
+# ARGV: key, expected value
+# Deletes key only if it still holds the expected value, returns 1 if it was deleted
+POP_IF_EQUAL_SCRIPT = """
+if redis.call("HGET", KEYS[1], ARGV[1]) == ARGV[2] then
+    return redis.call("HDEL", KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+
+def _uuid(user: Union["User", dict]) -> str:
+    return user["uuid"] if isinstance(user, dict) else str(user.uuid)
+
+
+def _claim_pairs_args(
+    prefix: str,
+    pairs: Sequence[Tuple[Union["User", dict], Union["User", dict]]],
+    shard_of: Callable[[Union["User", dict]], int] = lambda _user: 1,
+) -> list:
+    """``shard_of`` gives position of User's shard in KEYS of ``CLAIM_PAIRS_SCRIPT``"""
+    return [
+        prefix,
+        MATCHMAKING_PAIR_TTL,
+        *(arg for pair in pairs for user in pair for arg in (_uuid(user), shard_of(user))),
+    ]
+
+
+def _decode_users(uuids: Sequence[bytes], values: Sequence[Optional[bytes]]) -> List[dict]:
+    """Users already popped from hash are skipped"""
+    return [
+        {"uuid": uuid.decode(), **json.loads(value.decode())}
+        for uuid, value in zip(uuids, values)
+        if value is not None
+    ]
+
+
+def _split_windows(
+    windows: Sequence[Tuple[float, float, float]], found: Sequence[List[bytes]], users: Dict[str, dict]
+) -> List[List[dict]]:
+    """``found`` holds lower and upper half of every window, one after another"""
+    result = []
+    for (center, _, _), lower, upper in zip(windows, found[::2], found[1::2]):
+        in_window = [users[uuid.decode()] for uuid in lower + upper if uuid.decode() in users]
+        result.append(sorted(in_window, key=lambda user: abs(user["mu"] - center)))
+    return result
 
 
 class RedisHMap:
     def __init__(self, structure_name):
-        self._redis = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=1)
-        expiration_time = 180
-        self._redis.expire(structure_name, expiration_time)
+        self._redis = get_sync_redis()
         self.name = structure_name
 
     def __contains__(self, user) -> bool:
@@ -38,23 +126,225 @@ class RedisHMap:
 
 
 class RedisHMapMatchmakingStorage(RedisHMap):
+    """
+    Matchmaking queue: hash ``uuid -> {'mu', 'sigma', 'joined_at'}``
+    with sorted indexes over it by ``mu``, by ``joined_at`` and by time User was last seen
+    """
+
+    def __init__(self, structure_name):
+        super().__init__(structure_name)
+        self.mu_index = f"{structure_name}:mu"
+        self.joined_index = f"{structure_name}:joined"
+        self.seen_index = f"{structure_name}:seen"
+        self.pair_prefix = f"{structure_name}:pair:"
+
     def add_if_not_exists(self, user) -> bool:
         """Add user to storage. Returns 1 if User added and 0 if it's not"""
-        return self._redis.hset(self.name, key=str(user.uuid), value=str(user))
+        joined_at = time.time()
+        value = json.dumps({"mu": user.mu, "sigma": user.sigma, "joined_at": joined_at})
+        pipe = self._redis.pipeline()
+        pipe.hsetnx(self.name, str(user.uuid), value)
+        pipe.zadd(self.mu_index, {str(user.uuid): user.mu}, nx=True)
+        pipe.zadd(self.joined_index, {str(user.uuid): joined_at}, nx=True)
+        pipe.zadd(self.seen_index, {str(user.uuid): joined_at})
+        was_added, *_ = pipe.execute()
+        return was_added
 
     def add(self, key: str, value: str):
         return self._redis.hset(self.name, key=key, value=value)
 
     def pop_users(self, *users: Sequence[Union["User", dict]]):
-        users_uuids = [user["uuid"] if isinstance(user, dict) else str(user.uuid) for user in users]
-        self._redis.hdel(self.name, 1, *users_uuids)
+        users_uuids = [_uuid(user) for user in users]
+        pipe = self._redis.pipeline()
+        pipe.hdel(self.name, *users_uuids)
+        pipe.zrem(self.mu_index, *users_uuids)
+        pipe.zrem(self.joined_index, *users_uuids)
+        pipe.zrem(self.seen_index, *users_uuids)
+        pipe.execute()
 
     def __iter__(self) -> Iterable[dict]:
         """
-        :return: Iter({'uuid': str, 'mu': float, 'sigma': float})
+        :return: Iter({'uuid': str, 'mu': float, 'sigma': float, 'joined_at': float})
         """
         users = self._redis.hgetall(self.name)
         return map(
             lambda x: {"uuid": x[0].decode(), **json.loads(x[1].decode())},
             users.items(),
         )
+
+
+class AsyncRedisHMap:
+    """Asyncio version of ``RedisHMap``, all instances share connection pool of the process"""
+
+    def __init__(self, structure_name):
+        self.name = structure_name
+
+    async def contains(self, key: str) -> bool:
+        redis_ = await get_redis()
+        return bool(await redis_.hexists(self.name, key))
+
+    @timed(redis_operation_seconds, "length")
+    async def length(self) -> int:
+        redis_ = await get_redis()
+        return await redis_.hlen(self.name)
+
+    async def get(self, key: str) -> Optional[str]:
+        redis_ = await get_redis()
+        return await redis_.hget(self.name, key, encoding="utf-8")
+
+    @timed(redis_operation_seconds, "get_many")
+    @profiled(REDIS)
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        redis_ = await get_redis()
+        return await redis_.hmget(self.name, *keys, encoding="utf-8")
+
+    @profiled(REDIS)
+    async def add(self, key: str, value: str) -> bool:
+        redis_ = await get_redis()
+        return bool(await redis_.hset(self.name, key, value))
+
+    @profiled(REDIS)
+    async def pop(self, *keys: str) -> None:
+        """Delete ``keys`` from hash ``name``"""
+        if keys:
+            redis_ = await get_redis()
+            await redis_.hdel(self.name, *keys)
+
+    @profiled(REDIS)
+    async def pop_if_equal(self, key: str, value: str) -> bool:
+        """Delete ``key`` only if it still holds ``value``, atomically. Returns True if it was deleted"""
+        return bool(await run_script(POP_IF_EQUAL_SCRIPT, [self.name], [key, value]))
+
+
+class AsyncRedisHMapMatchmakingStorage(AsyncRedisHMap):
+    """Matchmaking queue of ``RedisHMapMatchmakingStorage`` for asyncio, commands of one operation are pipelined"""
+
+    def __init__(self, structure_name):
+        super().__init__(structure_name)
+        self.mu_index = f"{structure_name}:mu"
+        self.joined_index = f"{structure_name}:joined"
+        self.seen_index = f"{structure_name}:seen"
+        self.pair_prefix = f"{structure_name}:pair:"
+
+    @timed(redis_operation_seconds, "queue_add")
+    @profiled(REDIS)
+    async def add_if_not_exists(self, user) -> bool:
+        """Add user to storage. Returns True if User added and False if it's not"""
+        joined_at = time.time()
+        value = json.dumps({"mu": user.mu, "sigma": user.sigma, "joined_at": joined_at})
+        redis_ = await get_redis()
+        transaction = redis_.multi_exec()
+        was_added = transaction.hsetnx(self.name, str(user.uuid), value)
+        transaction.zadd(self.mu_index, user.mu, str(user.uuid), exist=redis_.ZSET_IF_NOT_EXIST)
+        transaction.zadd(self.joined_index, joined_at, str(user.uuid), exist=redis_.ZSET_IF_NOT_EXIST)
+        transaction.zadd(self.seen_index, joined_at, str(user.uuid))
+        await transaction.execute()
+        return bool(await was_added)
+
+    async def pop_users(self, *users: Sequence[Union["User", dict]]) -> None:
+        users_uuids = [_uuid(user) for user in users]
+        redis_ = await get_redis()
+        transaction = redis_.multi_exec()
+        transaction.hdel(self.name, *users_uuids)
+        transaction.zrem(self.mu_index, *users_uuids)
+        transaction.zrem(self.joined_index, *users_uuids)
+        transaction.zrem(self.seen_index, *users_uuids)
+        await transaction.execute()
+
+    async def put_back(self, users: Sequence[dict]) -> None:
+        """Return claimed users to the queue with their original ``joined_at``"""
+        if not users:
+            return
+        now = time.time()
+        redis_ = await get_redis()
+        transaction = redis_.multi_exec()
+        for user in users:
+            value = json.dumps({"mu": user["mu"], "sigma": user["sigma"], "joined_at": user["joined_at"]})
+            transaction.hsetnx(self.name, user["uuid"], value)
+            transaction.zadd(self.mu_index, user["mu"], user["uuid"], exist=redis_.ZSET_IF_NOT_EXIST)
+            transaction.zadd(self.joined_index, user["joined_at"], user["uuid"], exist=redis_.ZSET_IF_NOT_EXIST)
+            transaction.zadd(self.seen_index, now, user["uuid"])
+        await transaction.execute()
+
+    @timed(redis_operation_seconds, "touch")
+    async def touch(self, user_uuid: str) -> bool:
+        """User is still waiting: refresh the time User was last seen. Returns False if User left the queue"""
+        redis_ = await get_redis()
+        transaction = redis_.multi_exec()
+        transaction.zadd(self.seen_index, time.time(), user_uuid, exist=redis_.ZSET_IF_EXIST)
+        is_queued = transaction.hexists(self.name, user_uuid)
+        await transaction.execute()
+        return bool(await is_queued)
+
+    @timed(redis_operation_seconds, "sweep")
+    async def sweep(self, cutoff: float, limit: int = 1000) -> int:
+        """
+        Remove users not seen since ``cutoff``, e.g. of crashed servers
+
+        :return: int how many users were removed
+        """
+        return await run_script(SWEEP_SCRIPT, self._keys(), [cutoff, limit])
+
+    @timed(redis_operation_seconds, "claim_pairs")
+    async def claim_pairs(self, pairs: Sequence[Tuple[Union["User", dict], Union["User", dict]]]) -> List[bool]:
+        """
+        Atomically take every pair out of the queue, if both its users are still there.
+        Safe for many matchmaking processes sharing one queue, costs one round trip.
+
+        :return: True for every claimed pair
+        """
+        if not pairs:
+            return []
+        claimed = await run_script(CLAIM_PAIRS_SCRIPT, self._keys(), _claim_pairs_args(self.pair_prefix, pairs))
+        return [bool(value) for value in claimed]
+
+    async def get_enemy(self, user_uuid: str) -> Optional[str]:
+        """Enemy of recently claimed pair"""
+        redis_ = await get_redis()
+        return await redis_.get(f"{self.pair_prefix}{user_uuid}", encoding="utf-8")
+
+    @timed(redis_operation_seconds, "oldest")
+    async def oldest(self, count: int) -> List[dict]:
+        """``count`` longest waiting users"""
+        redis_ = await get_redis()
+        uuids = await redis_.zrange(self.joined_index, 0, count - 1)
+        return await self._get_users(uuids)
+
+    @timed(redis_operation_seconds, "windows")
+    async def windows(self, windows: Sequence[Tuple[float, float, float]], limit: int) -> List[List[dict]]:
+        """
+        Users whose mu is inside each window, nearest to window's center first
+
+        :param windows: ((center_mu, min_mu, max_mu), ...)
+        :param limit: max users fetched on each side of the center
+        :return: users for every window
+        """
+        if not windows:
+            return []
+        redis_ = await get_redis()
+        pipe = redis_.pipeline()
+        futures = []
+        for center, min_mu, max_mu in windows:
+            futures.append(pipe.zrevrangebyscore(self.mu_index, center, min_mu, offset=0, count=limit))
+            futures.append(
+                pipe.zrangebyscore(
+                    self.mu_index, center, max_mu, offset=0, count=limit, exclude=redis_.ZSET_EXCLUDE_MIN
+                )
+            )
+        await pipe.execute()
+        found = [future.result() for future in futures]
+        users = {user["uuid"]: user for user in await self._get_users(set().union(*found))}
+        return _split_windows(windows, found, users)
+
+    def _keys(self) -> List[str]:
+        """KEYS of one shard in scripts"""
+        return [self.name, self.mu_index, self.joined_index, self.seen_index]
+
+    async def _get_users(self, uuids: Iterable[bytes]) -> List[dict]:
+        uuids = list(uuids)
+        if not uuids:
+            return []
+        redis_ = await get_redis()
+        return _decode_users(uuids, await redis_.hmget(self.name, *uuids))
@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+import aioredis
+import redis
+
+from conf.settings import REDIS_DB, REDIS_HOST, REDIS_POOL_MAXSIZE, REDIS_POOL_MINSIZE, REDIS_PORT
+from services.metrics import histogram
+
+redis_operation_seconds = histogram(
+    "redis_operation_seconds", "Round trips of Redis operations, one or more commands", labels=("operation",)
+)
+
+_pool: Optional[aioredis.Redis] = None
+_lock: Optional[asyncio.Lock] = None
+_sync_client: Optional[redis.Redis] = None
+
+
+def _connect() -> Awaitable[aioredis.Redis]:
+    return aioredis.create_redis_pool(
+        (REDIS_HOST, int(REDIS_PORT)),
+        db=REDIS_DB,
+        minsize=REDIS_POOL_MINSIZE,
+        maxsize=REDIS_POOL_MAXSIZE,
+    )
+
+
+def _connect_sync() -> redis.Redis:
+    return redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
+
+
+def use_redis(connect: Callable[[], Awaitable[aioredis.Redis]], connect_sync: Callable[[], redis.Redis]) -> None:
+    """
+    Replace Redis server of the process, e.g. with an in-memory one for load tests.
+    Must be called before the first client is created.
+
+    :param connect: creates async pool returned by ``get_redis``
+    :param connect_sync: creates client returned by ``get_sync_redis``
+    """
+    global _connect, _connect_sync, _pool, _sync_client
+    _connect, _connect_sync, _pool, _sync_client = connect, connect_sync, None, None
+
+
+def get_sync_redis() -> redis.Redis:
+    """Client shared by the whole process, created on first use, safe to use from many threads"""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = _connect_sync()
+    return _sync_client
+
+
+async def get_redis() -> aioredis.Redis:
+    """Bounded connection pool shared by the whole process, created on first use"""
+    global _pool, _lock
+    if _pool is not None and not _pool.closed:
+        return _pool
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        if _pool is None or _pool.closed:
+            _pool = await _connect()
+    return _pool
+
+
+async def close_redis() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
+
+
+@lru_cache(maxsize=None)
+def _script_sha(script: str) -> str:
+    return hashlib.sha1(script.encode()).hexdigest()  # noqa: S303
+
+
+async def run_script(script: str, keys: Sequence[Any], args: Sequence[Any]) -> Any:
+    """EVALSHA of Lua script, sent whole with EVAL only if Redis doesn't know it yet"""
+    redis_ = await get_redis()
+    try:
+        return await redis_.evalsha(_script_sha(script), keys, args)
+    except aioredis.ReplyError as err:
+        if not str(err).startswith("NOSCRIPT"):
+            raise
+        return await redis_.eval(script, keys, args)
@@ -0,0 +1,83 @@
+import uuid
+from typing import List, Optional, Sequence, Tuple
+
+from conf.settings import ROOM_TTL
+from services.metrics import timed
+from services.profiling import REDIS, profiled
+from services.redis_pool import get_redis, redis_operation_seconds, run_script
+
+# KEYS: member key of popping user, then member keys of the other users, ARGV: room
+# Room is taken only once: if popping user is still in the room, member keys still holding it are deleted.
+# Returns 1 if the room was taken
+POP_ROOM_SCRIPT = """
+if redis.call("GET", KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+for index = 2, #KEYS do
+    if redis.call("GET", KEYS[index]) == ARGV[1] then
+        redis.call("DEL", KEYS[index])
+    end
+end
+redis.call("DEL", KEYS[1])
+return 1
+"""
+
+Room = Tuple[str, List[str]]
+
+
+class RoomStore:
+    """
+    Rooms of running matches in Redis, no DB rows.
+
+    Every member has a key ``{prefix}{user uuid} -> 'room_id uuid uuid ...'``,
+    so the room of a User is found with one GET. Keys expire after ``ttl`` seconds
+    in case a match is never finished.
+    """
+
+    def __init__(self, prefix: str, ttl: int = ROOM_TTL):
+        self.prefix = prefix
+        self.ttl = ttl
+
+    @timed(redis_operation_seconds, "room_create")
+    @profiled(REDIS)
+    async def create(self, users_uuids: Sequence[str]) -> str:
+        """Create room with all members in one transaction, returns room id"""
+        room_id = uuid.uuid4().hex
+        room = " ".join([room_id, *users_uuids])
+        redis_ = await get_redis()
+        transaction = redis_.multi_exec()
+        for user_uuid in users_uuids:
+            transaction.set(f"{self.prefix}{user_uuid}", room, expire=self.ttl)
+        await transaction.execute()
+        return room_id
+
+    async def get(self, user_uuid: str) -> Optional[Room]:
+        """(room id, members) of User's room"""
+        redis_ = await get_redis()
+        return self._decode(await redis_.get(f"{self.prefix}{user_uuid}", encoding="utf-8"))
+
+    @timed(redis_operation_seconds, "room_pop")
+    @profiled(REDIS)
+    async def pop(self, user_uuid: str) -> Optional[Room]:
+        """Atomically remove User's room: only one caller gets it"""
+        redis_ = await get_redis()
+        key = f"{self.prefix}{user_uuid}"
+        while True:
+            room = await redis_.get(key, encoding="utf-8")
+            if room is None:
+                return None
+            _, users_uuids = self._decode(room)
+            keys = [key, *(f"{self.prefix}{member}" for member in users_uuids if member != user_uuid)]
+            # the script declares every key it touches, it fails only if the room was taken meanwhile
+            if await run_script(POP_ROOM_SCRIPT, keys, [room]):
+                return self._decode(room)
+
+    @staticmethod
+    def _decode(room: Optional[str]) -> Optional[Room]:
+        if room is None:
+            return None
+        room_id, *users_uuids = room.split()
+        return room_id, users_uuids
+
+
+rooms = RoomStore("Room:")
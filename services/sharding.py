@@ -0,0 +1,144 @@
+import asyncio
+import math
+from typing import Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from game_auth.models import User
+
+from trueskill import global_env
+
+from conf.settings import (
+    MATCHMAKING_DEFAULT_MODE,
+    MATCHMAKING_MODES,
+    MATCHMAKING_SHARD_BAND_WIDTH,
+    MATCHMAKING_SHARD_COUNT,
+)
+from services.metrics import timed
+from services.redis_hash import (
+    CLAIM_PAIRS_SCRIPT,
+    AsyncRedisHMapMatchmakingStorage,
+    _claim_pairs_args,
+)
+from services.redis_pool import redis_operation_seconds, run_script
+
+
+class QueueShard(AsyncRedisHMapMatchmakingStorage):
+    """
+    One rating band of one game mode.
+
+    Enemies are also searched in adjacent bands, so users near a band boundary
+    are matched across it. Users read from shards are tagged with ``'shard'``.
+    """
+
+    def __init__(self, structure_name: str, queue: "ShardedQueue"):
+        super().__init__(structure_name)
+        self.queue = queue
+        self.pair_prefix = queue.pair_prefix
+        self.neighbours: List[QueueShard] = []
+
+    async def oldest(self, count: int) -> List[dict]:
+        return self._tag(await super().oldest(count))
+
+    async def windows(self, windows: Sequence[Tuple[float, float, float]], limit: int) -> List[List[dict]]:
+        """Users of this shard and its neighbours inside each window, nearest to window's center first"""
+        shards = [self, *self.neighbours]
+        found = await asyncio.gather(
+            *(AsyncRedisHMapMatchmakingStorage.windows(shard, windows, limit) for shard in shards)
+        )
+        result = []
+        for index, (center, _, _) in enumerate(windows):
+            in_window = [user for shard, users in zip(shards, found) for user in shard._tag(users[index])]
+            result.append(sorted(in_window, key=lambda user: abs(user["mu"] - center))[: 2 * limit])
+        return result
+
+    async def claim_pairs(self, pairs: Sequence[Tuple[dict, dict]]) -> List[bool]:
+        return await self.queue.claim_pairs(pairs)
+
+    async def put_back(self, users: Sequence[dict]) -> None:
+        """Users go back to the shards they were read from"""
+        await asyncio.gather(
+            *(
+                AsyncRedisHMapMatchmakingStorage.put_back(self.queue.shards[user.get("shard", self.name)], [user])
+                for user in users
+            )
+        )
+
+    def _tag(self, users: List[dict]) -> List[dict]:
+        for user in users:
+            user["shard"] = self.name
+        return users
+
+
+class ShardedQueue:
+    """
+    Matchmaking queue split by game mode and rating band.
+
+    Band of User is decided by mu only: bands are ``band_width`` wide around default mu,
+    the first and the last bands are open-ended. Every shard has its own keys,
+    so matchmaking processes owning different shards don't contend on one queue.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        modes: Sequence[str] = MATCHMAKING_MODES,
+        shard_count: int = MATCHMAKING_SHARD_COUNT,
+        band_width: float = MATCHMAKING_SHARD_BAND_WIDTH,
+    ):
+        self.name = name
+        self.modes = tuple(modes)
+        self.shard_count = shard_count
+        self.band_width = band_width
+        self.pair_prefix = f"{name}:pair:"
+        self.shards: Dict[str, QueueShard] = {}
+        for mode in self.modes:
+            bands = [QueueShard(f"{name}:{mode}:{band}", self) for band in range(shard_count)]
+            for band, shard in enumerate(bands):
+                shard.neighbours = bands[max(band - 1, 0) : band] + bands[band + 1 : band + 2]
+                self.shards[shard.name] = shard
+
+    def band(self, mu: float) -> int:
+        band = math.floor((mu - global_env().mu) / self.band_width) + self.shard_count // 2
+        return min(max(band, 0), self.shard_count - 1)
+
+    def shard_for(self, mu: float, mode: str = MATCHMAKING_DEFAULT_MODE) -> QueueShard:
+        """Shard where User with ``mu`` waits, raises KeyError for unknown mode"""
+        if mode not in self.modes:
+            raise KeyError(mode)
+        return self.shards[f"{self.name}:{mode}:{self.band(mu)}"]
+
+    def owned(self, process_index: int, process_count: int) -> List[QueueShard]:
+        """Shards matched by process ``process_index`` of ``process_count``, every shard has one owner"""
+        return list(self.shards.values())[process_index::process_count]
+
+    async def add_if_not_exists(self, user: "User", mode: str = MATCHMAKING_DEFAULT_MODE) -> Optional[QueueShard]:
+        """Put User in their shard. Returns the shard, or None if User already waits there"""
+        shard = self.shard_for(user.mu, mode)
+        return shard if await shard.add_if_not_exists(user) else None
+
+    async def touch(self, user_uuid: str, mu: float, mode: str = MATCHMAKING_DEFAULT_MODE) -> bool:
+        """User with ``mu`` still waits in ``mode``. Returns False if User left the queue"""
+        return await self.shard_for(mu, mode).touch(user_uuid)
+
+    async def remove(self, user_uuid: str) -> None:
+        """Take User out of every shard"""
+        await asyncio.gather(*(shard.pop_users({"uuid": user_uuid}) for shard in self.shards.values()))
+
+    @timed(redis_operation_seconds, "claim_pairs")
+    async def claim_pairs(self, pairs: Sequence[Tuple[dict, dict]]) -> List[bool]:
+        """
+        Atomically take every pair out of the shards of its users, if both are still there
+
+        :param pairs: users tagged with ``'shard'``
+        :return: True for every claimed pair
+        """
+        if not pairs:
+            return []
+        shards = list(dict.fromkeys(user["shard"] for pair in pairs for user in pair))
+        keys = [key for name in shards for key in self.shards[name]._keys()]
+        position = {name: 1 + 4 * index for index, name in enumerate(shards)}
+        args = _claim_pairs_args(self.pair_prefix, pairs, shard_of=lambda user: position[user["shard"]])
+        return [bool(value) for value in await run_script(CLAIM_PAIRS_SCRIPT, keys, args)]
+
+
+queue = ShardedQueue("TestHMap1")
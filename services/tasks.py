@@ -0,0 +1,115 @@
+"""
+Background tasks started by websocket consumers, e.g. matchmaking searches of waiting users.
+
+Every task belongs to the ``TaskGroup`` of one consumer and is counted by the ``TaskRegistry`` of the process.
+Long-lived tasks of services, e.g. matchmaking schedulers and write-behind flushes,
+are started by ``service_tasks``, which has no limit but logs and counts their failures the same way.
+Starting a task under a name already running in the group cancels the running one,
+``cancel`` stops the tasks of a group, e.g. on disconnect. The registry runs at most ``limit`` tasks at once,
+logs exceptions of failed tasks and exports counts of running tasks as metrics.
+"""
+import asyncio
+import logging
+import sys
+from collections import Counter
+from typing import Coroutine, Dict, Optional
+
+from conf.settings import BACKGROUND_TASKS_LIMIT
+from services.metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+running_tasks = gauge("background_tasks", "Background tasks running", labels=("name",))
+rejected_tasks = counter(
+    "background_tasks_rejected_total", "Tasks not started, the limit was reached", labels=("name",)
+)
+failed_tasks = counter("background_tasks_failed_total", "Tasks finished with an exception", labels=("name",))
+
+
+class TaskLimitError(RuntimeError):
+    def __init__(self, name: str, limit: int):
+        super().__init__(f"Task {name} is not started, {limit} tasks are already running")
+        self.name = name
+        self.limit = limit
+
+
+class TaskRegistry:
+    def __init__(self, limit: int = BACKGROUND_TASKS_LIMIT):
+        self.limit = limit
+        self._tasks: Dict[asyncio.Task, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    @property
+    def full(self) -> bool:
+        return len(self._tasks) >= self.limit
+
+    def counts(self) -> Dict[str, int]:
+        """Running tasks per name"""
+        return dict(Counter(self._tasks.values()))
+
+    def start(self, name: str, coroutine: Coroutine) -> asyncio.Task:
+        """Run ``coroutine`` as a task, raises TaskLimitError if ``limit`` tasks are already running"""
+        if self.full:
+            coroutine.close()
+            rejected_tasks.labels(name).inc()
+            raise TaskLimitError(name, self.limit)
+        task = asyncio.get_event_loop().create_task(coroutine)
+        self._tasks[task] = name
+        running_tasks.labels(name).inc()
+        task.add_done_callback(self._finished)
+        return task
+
+    def _finished(self, task: asyncio.Task) -> None:
+        name = self._tasks.pop(task)
+        running_tasks.labels(name).dec()
+        if task.cancelled() or task.exception() is None:
+            return
+        failed_tasks.labels(name).inc()
+        logger.error("Background task %s failed", name, exc_info=task.exception())
+
+
+class TaskGroup:
+    """Tasks of one consumer, at most one per name"""
+
+    def __init__(self, registry: Optional[TaskRegistry] = None):
+        self.registry = background_tasks if registry is None else registry
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tasks
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def start(self, name: str, coroutine: Coroutine) -> asyncio.Task:
+        """Cancel running task ``name`` and run ``coroutine`` instead, raises TaskLimitError"""
+        self.cancel(name)
+        task = self.registry.start(name, coroutine)
+        self._tasks[name] = task
+        task.add_done_callback(lambda _task: self._forget(name, _task))
+        return task
+
+    def cancel(self, name: Optional[str] = None) -> bool:
+        """
+        Cancel running task ``name``, every task of the group by default
+
+        :return: True if any task was running
+        """
+        if name is None:
+            tasks = list(self._tasks.values())
+            self._tasks.clear()
+        else:
+            tasks = [self._tasks.pop(name)] if name in self._tasks else []
+        for task in tasks:
+            task.cancel()
+        return bool(tasks)
+
+    def _forget(self, name: str, task: asyncio.Task) -> None:
+        if self._tasks.get(name) is task:
+            del self._tasks[name]
+
+
+background_tasks = TaskRegistry()
+service_tasks = TaskRegistry(limit=sys.maxsize)
@@ -1,17 +1,153 @@
 import asyncio
+import logging
+import math
 import random
-from typing import Sequence, Optional, TYPE_CHECKING
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Optional, Tuple, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from game_auth.models import User
 
-from channels.db import database_sync_to_async
-from channels.generic.websocket import AsyncWebsocketConsumer
-from trueskill import quality, rate, Rating
+import numpy as np
+from trueskill import global_env, quality, rate, Rating
 
-from services.redis_hash import RedisHMapMatchmakingStorage
+from conf.settings import COMPUTE_POOL_BATCH_SIZE, COMPUTE_POOL_MAX_PENDING, COMPUTE_POOL_WORKERS
+from services.leaderboard import leaderboard
+from services.metrics import counter, gauge, histogram
+from services.quality import quality_vector
+from services.rating import rate_1vs1
+from services.rating_writer import rating_writer
+from services.tasks import service_tasks
 
-redis_hash = RedisHMapMatchmakingStorage("TestHMap1")
+POOL = "pool"
+INLINE = "inline"
+
+logger = logging.getLogger(__name__)
+
+compute_calls = counter("compute_calls_total", "Quality and rating computations", labels=("where",))
+compute_saturated = counter("compute_pool_saturated_total", "Computations run inline because the pool was full")
+compute_pending = gauge("compute_pool_pending", "Computations sent to the pool and not finished yet")
+compute_batch_size = histogram(
+    "compute_batch_size", "Items sent together in one computation", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+
+
+class ComputePool:
+    """
+    CPU-bound quality and rating math off the event loop.
+
+    Computations run in a pool of ``workers`` processes, so the GIL doesn't serialize them with websocket traffic.
+    They run inline when the pool is off, broken, or already has ``max_pending`` computations.
+    Items passed to ``submit`` in one loop iteration are computed together, in batches of ``batch_size``.
+    """
+
+    def __init__(
+        self,
+        workers: int = COMPUTE_POOL_WORKERS,
+        max_pending: int = COMPUTE_POOL_MAX_PENDING,
+        batch_size: int = COMPUTE_POOL_BATCH_SIZE,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._batches: Dict[Callable, List[Tuple[Any, asyncio.Future]]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Result of ``func(*args)``, both must be picklable"""
+        if not self.enabled:
+            return self._run_inline(func, *args)
+        if self._pending >= self.max_pending:
+            compute_saturated.inc()
+            return self._run_inline(func, *args)
+        self._pending += 1
+        compute_pending.set(self._pending)
+        try:
+            return await self._run_in_pool(func, *args)
+        finally:
+            self._pending -= 1
+            compute_pending.set(self._pending)
+
+    async def submit(self, batch_func: Callable[[List], List], item: Any) -> Any:
+        """Result for ``item`` of ``batch_func(items)``, which returns one result for every item"""
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        batch = self._batches.setdefault(batch_func, [])
+        batch.append((item, future))
+        if len(batch) >= self.batch_size:
+            self._flush(batch_func)
+        elif len(batch) == 1:
+            loop.call_soon(self._flush, batch_func)
+        return await future
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _flush(self, batch_func: Callable[[List], List]) -> None:
+        batch = self._batches.pop(batch_func, None)
+        if batch:
+            service_tasks.start("compute_batch", self._compute_batch(batch_func, batch))
+
+    async def _compute_batch(self, batch_func: Callable[[List], List], batch: List[Tuple[Any, asyncio.Future]]):
+        items, futures = zip(*batch)
+        compute_batch_size.observe(len(items))
+        try:
+            results = await self.run(batch_func, list(items))
+        except Exception as error:
+            for future in futures:
+                _resolve(future, exception=error)
+            return
+        for future, result in zip(futures, results):
+            _resolve(future, result)
+
+    async def _run_in_pool(self, func: Callable, *args) -> Any:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            result = await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+        except BrokenProcessPool:
+            logger.exception("Compute pool is broken, it is restarted on next computation")
+            self.close()
+            return self._run_inline(func, *args)
+        compute_calls.labels(POOL).inc()
+        return result
+
+    @staticmethod
+    def _run_inline(func: Callable, *args) -> Any:
+        compute_calls.labels(INLINE).inc()
+        return func(*args)
+
+
+def _resolve(future: asyncio.Future, result: Any = None, exception: Optional[Exception] = None) -> None:
+    """Caller may be cancelled while waiting"""
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+compute_pool = ComputePool()
+
+
+def rate_1vs1_batch(matches: List[Tuple[float, float, float, float]]) -> List[Tuple[float, float, float, float]]:
+    """
+    New ratings of independent 1 vs 1 matches in one vectorized call
+
+    :param matches: (winner mu, winner sigma, loser mu, loser sigma) of every match
+    :return: new (winner mu, winner sigma, loser mu, loser sigma) of every match
+    """
+    columns = np.array(matches, dtype=np.float64).reshape(-1, 4).T
+    return [tuple(match) for match in np.column_stack(rate_1vs1(*columns)).tolist()]
 
 
 class MM:
@@ -23,6 +159,12 @@ class MM:
         :param users: from winner to looser
         :return: ((winner.mu, winner.sigma), (looser.mu, looser.sigma))
         """
+        if len(users) == 2:
+            winner, looser = users
+            winner_mu, winner_sigma, looser_mu, looser_sigma = rate_1vs1(
+                winner.mu, winner.sigma, looser.mu, looser.sigma
+            )
+            return (Rating(float(winner_mu), float(winner_sigma)),), (Rating(float(looser_mu), float(looser_sigma)),)
         rating_group = [(Rating(u.mu, u.sigma),) for u in users]
         return rate(rating_group)
 
@@ -31,6 +173,37 @@ class MM:
         rating_group = [(Rating(mu, sigma),) for mu, sigma in mu_and_sigmas]
         return quality(rating_group)
 
+    @staticmethod
+    def get_mu_window(mu: float, sigma: float, threshold: float) -> Tuple[float, float]:
+        """
+        Range of enemy mu where 1 vs 1 match probability with (mu, sigma) can exceed threshold
+
+        Match probability is ``sqrt(2 * beta^2 / c2) * exp(-(mu - enemy_mu)^2 / (2 * c2))``
+        with ``c2 = 2 * beta^2 + sigma^2 + enemy_sigma^2``, so the allowed mu distance is
+        ``sqrt(c2 * ln(2 * beta^2 / (c2 * threshold^2)))``, taken at the worst enemy sigma.
+
+        :return: (min_mu, max_mu)
+        """
+        if threshold <= 0:
+            return -math.inf, math.inf
+        env = global_env()
+        biggest_c2 = 2 * env.beta ** 2 / (math.e * threshold ** 2)
+        min_c2 = 2 * env.beta ** 2 + sigma ** 2
+        max_c2 = min_c2 + max(env.sigma, sigma) ** 2
+        c2 = min(max(biggest_c2, min_c2), max_c2)
+        distance_square = c2 * math.log(2 * env.beta ** 2 / (c2 * threshold ** 2))
+        if distance_square < 0:
+            return mu, mu
+        distance = math.sqrt(distance_square)
+        return mu - distance, mu + distance
+
+    @staticmethod
+    def get_match_probabilities(user: dict, enemies: Sequence[dict]) -> np.ndarray:
+        """1 vs 1 match probability of User with every enemy"""
+        mus = np.fromiter((enemy["mu"] for enemy in enemies), dtype=np.float64, count=len(enemies))
+        sigmas = np.fromiter((enemy["sigma"] for enemy in enemies), dtype=np.float64, count=len(enemies))
+        return quality_vector(user["mu"], user["sigma"], mus, sigmas)
+
     @staticmethod
     def update_mu_sigma_for_users(users: Sequence["User"], data: Sequence[Sequence[Rating]]) -> None:
         """
@@ -39,7 +212,10 @@ class MM:
         :return: None
         """
         for user, tuple_with_rating in zip(users, data):
-            user.update(mu=tuple_with_rating[0].mu, sigma=tuple_with_rating[0].sigma)
+            user.mu = tuple_with_rating[0].mu
+            user.sigma = tuple_with_rating[0].sigma
+            rating_writer.add(user)
+        leaderboard.update({str(user.uuid): MM.calculate_rating(user.mu, user.sigma) for user in users})
 
     @staticmethod
     def calculate_rating(mu, sigma):
@@ -54,52 +230,39 @@ class MM:
         MM.update_mu_sigma_for_users(users, new_mu_sigmas_for_users)
         return users
 
-    @classmethod
-    async def find_match_for_user(  # noqa: CCR001
-        cls, consumer: AsyncWebsocketConsumer.__class__, user: "User", search_times: Optional[int] = 0
-    ) -> None:
+    @staticmethod
+    async def rate_1_vs_1_random_winner(users: Sequence["User"]) -> Tuple[List["User"], Sequence[Sequence[Rating]]]:
         """
-        Find User and Enemy else just wait and increase user probability to find match
+        New mu and sigma computed in ``compute_pool``, users are not updated
 
-        :param consumer: AsyncWebsocketConsumer
-        :param user: User
-        :param search_times: int how match this function called
-        :return: (User, User)
+        :return: (users from winner to looser, ratings for ``update_mu_sigma_for_users``)
         """
-        was_added = redis_hash.add_if_not_exists(user)
-        if not was_added:
-            return
-        while True:
-            if user not in redis_hash:
-                return
-            if len(redis_hash) > 1:
-                is_enemy_found = await cls._find_enemy_in_redis(user, search_times, consumer)
-                if is_enemy_found:
-                    return
-                search_times += 1
-            await asyncio.sleep(1)
+        users = list(users)
+        random.shuffle(users)
+        winner, looser = users
+        winner_mu, winner_sigma, looser_mu, looser_sigma = await compute_pool.submit(
+            rate_1vs1_batch, (winner.mu, winner.sigma, looser.mu, looser.sigma)
+        )
+        return users, ((Rating(winner_mu, winner_sigma),), (Rating(looser_mu, looser_sigma),))
 
     @classmethod
-    async def _find_enemy_in_redis(
-        cls, user: "User", search_times: int, consumer: AsyncWebsocketConsumer.__class__
-    ) -> bool:
-        """For each enemy in redis we calculating probability his match with User"""
-        for enemy in redis_hash:
-            prob = cls.get_match_probability((user.mu, user.sigma), (enemy["mu"], enemy["sigma"]))
-            if prob > cls.probability - (0.01 * search_times) and enemy["uuid"] != str(user.uuid):
-                await cls.callback_to_consumer(consumer, user, enemy)
-                return True
-        return False
+    def get_threshold(cls, search_times: int) -> float:
+        """Match probability needed, lowered the longer User waits"""
+        return cls.probability - (0.01 * search_times)
 
     @classmethod
-    async def callback_to_consumer(cls, consumer: AsyncWebsocketConsumer.__class__, user: "User", enemy: dict):
-        enemy = await cls.find_user_model(enemy["uuid"])
-        redis_hash.pop_users(user, enemy)
-        await consumer.handlers["matchmaking"].start_match(consumer, user, enemy)
-
-    @staticmethod
-    @database_sync_to_async
-    def find_user_model(user_uuid: str):
-        from game_auth.models import User
+    def find_enemy(cls, user: dict, search_times: int, enemies: Iterable[dict]) -> Optional[dict]:
+        """
+        Find first enemy whose match probability with User is above threshold
 
-        return User.objects.get(uuid=user_uuid)
+        :param user: {'uuid': str, 'mu': float, 'sigma': float}
+        :param search_times: int how many rounds User already waits
+        :param enemies: Iter({'uuid': str, 'mu': float, 'sigma': float})
+        :return: enemy or None
+        """
+        enemies = [enemy for enemy in enemies if enemy["uuid"] != user["uuid"]]
+        if not enemies:
+            return None
+        probs = cls.get_match_probabilities(user, enemies)
+        above_threshold = np.flatnonzero(probs > cls.get_threshold(search_times))
+        return enemies[above_threshold[0]] if above_threshold.size else None
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from channels.db import database_sync_to_async
+
+from services.tasks import service_tasks
+
+
+class WriteBehind(ABC):
+    """
+    Values are collected in memory and saved in bulk once ``flush_size`` are pending
+    or ``flush_interval`` seconds passed. Values of a failed save are put back and saved by the next flush.
+
+    Subclasses define the container of pending values, how they are saved and put back.
+    """
+
+    task_name = "write_behind"
+
+    def __init__(self, flush_size: int, flush_interval: float):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending = self._empty()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @abstractmethod
+    def _empty(self):
+        """New empty container of pending values"""
+
+    @abstractmethod
+    def _save(self, pending) -> int:
+        """Save ``pending`` values, returns how many were saved"""
+
+    @abstractmethod
+    def restore(self, pending) -> None:
+        """Put back values which were not saved"""
+
+    def flush_if_due(self) -> None:
+        if len(self._pending) >= self.flush_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Save all pending values, synchronous
+
+        :return: int how many values were saved
+        """
+        with self._lock:
+            pending, self._pending = self._pending, self._empty()
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            return self._save(pending)
+        except Exception:
+            self.restore(pending)
+            raise
+
+    def ensure_running(self) -> None:
+        """Start flushing by time in event loop, if something is pending"""
+        if self._pending and (self._task is None or self._task.done()):
+            self._task = service_tasks.start(self.task_name, self.run())
+
+    async def run(self) -> None:
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            await database_sync_to_async(self.flush)()
@@ -0,0 +1,46 @@
+import uuid
+
+import pytest
+
+from services.channel_registry import ChannelNameRegistry
+
+
+@pytest.mark.asyncio
+async def test_channel_names_of_other_workers_are_read_from_redis():
+    name = f"TestChannelNames{uuid.uuid4().hex}"
+    worker, other_worker = ChannelNameRegistry(name), ChannelNameRegistry(name)
+    local, remote, unknown = (str(uuid.uuid4()) for _ in range(3))
+    await worker.register(local, "channel.local")
+    await other_worker.register(remote, "channel.remote")
+
+    assert await worker.get_many([remote, unknown, local]) == ["channel.remote", None, "channel.local"]
+    assert await other_worker.get(local) == "channel.local"
+
+    await worker.unregister(local, "channel.local")
+    assert await worker.get(local) is None
+    assert await other_worker.get_many([local, remote]) == [None, "channel.remote"]
+
+
+@pytest.mark.asyncio
+async def test_local_channel_names_are_not_read_from_redis():
+    registry = ChannelNameRegistry(f"TestChannelNames{uuid.uuid4().hex}")
+    user_uuid = str(uuid.uuid4())
+    await registry.register(user_uuid, "channel.local")
+    await registry.storage.pop(user_uuid)
+    assert await registry.get_many([user_uuid]) == ["channel.local"]
+
+
+@pytest.mark.asyncio
+async def test_closing_older_connection_keeps_channel_name_of_resumed_user():
+    name = f"TestChannelNames{uuid.uuid4().hex}"
+    worker, other_worker = ChannelNameRegistry(name), ChannelNameRegistry(name)
+    user_uuid = str(uuid.uuid4())
+    # the same token resumed User on a connection of another worker, then the older connection closed
+    await worker.register(user_uuid, "channel.old")
+    await other_worker.register(user_uuid, "channel.new")
+    await worker.unregister(user_uuid, "channel.old")
+    assert await worker.get(user_uuid) == "channel.new"
+    assert await other_worker.get(user_uuid) == "channel.new"
+
+    await other_worker.unregister(user_uuid, "channel.new")
+    assert await worker.get(user_uuid) is None
@@ -0,0 +1,68 @@
+import uuid
+
+import pytest
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from game_auth.models import User
+from services.leaderboard import Leaderboard, leaderboard
+from services.user_matchmaking import MM
+
+
+@pytest.fixture
+def board():
+    board = Leaderboard(f"TestLeaderboard{uuid.uuid4().hex}")
+    board.update({f"user{index}": float(index) for index in range(10)})
+    return board
+
+
+def test_top_rank_and_around(board):
+    assert [entry["uuid"] for entry in board.top(3)] == ["user9", "user8", "user7"]
+    assert board.rank("user7") == {"uuid": "user7", "rating": 7.0, "rank": 3}
+    assert board.rank("unknown") is None
+    assert [entry["rank"] for entry in board.around("user8", 2)] == [1, 2, 3, 4]
+    assert board.around("unknown", 2) == []
+
+    board.update({"user0": 100.0})
+    assert board.top(1) == [{"uuid": "user0", "rating": 100.0, "rank": 1}]
+
+
+def test_rebuild_replaces_all_ratings(board):
+    assert board.rebuild([{"new1": 1.0}, {"new2": 2.0}]) == 2
+    assert [entry["uuid"] for entry in board.top(10)] == ["new2", "new1"]
+
+
+@pytest.mark.django_db
+def test_leaderboard_api_after_rebuild_from_db():
+    best = User.objects.create(username="best", mu=40, sigma=1)
+    User.objects.create(username="worst", mu=10, sigma=1)
+    call_command("rebuild_leaderboard", chunk_size=1)
+    assert len(leaderboard) == 2
+
+    client = APIClient()
+    top = client.get("/api/leaderboard/", {"count": 1}).json()["top"]
+    assert top == [{"uuid": str(best.uuid), "rating": best.rating, "rank": 1}]
+    player = client.get(f"/api/leaderboard/{best.uuid}/", {"count": 1}).json()
+    assert player["player"]["rank"] == 1
+    assert len(player["around"]) == 2
+    assert client.get(f"/api/leaderboard/{uuid.uuid4()}/").status_code == 404
+
+
+@pytest.mark.django_db
+def test_stored_rating_follows_mu_and_sigma_on_every_write_path():
+    user = User.objects.create(username="player", mu=30, sigma=2)
+    assert User.objects.get(pk=user.pk).rating == MM.calculate_rating(30, 2)
+
+    user.update(35, 2)
+    assert User.objects.get(pk=user.pk).rating == MM.calculate_rating(35, 2)
+
+    user.mu = 20
+    User.objects.bulk_update([user], fields=["mu"])
+    assert User.objects.get(pk=user.pk).rating == MM.calculate_rating(20, 2)
+
+    User.objects.filter(pk=user.pk).update(sigma=4)
+    assert User.objects.get(pk=user.pk).rating == MM.calculate_rating(20, 4)
+    assert list(User.objects.rating_between(1000, 2000)) == [user]
+
+    (created,) = User.objects.bulk_create([User(username="created", mu=40, sigma=1)])
+    assert User.objects.get(pk=created.pk).rating == MM.calculate_rating(40, 1)
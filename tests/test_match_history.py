@@ -0,0 +1,40 @@
+import uuid
+
+import numpy as np
+import pytest
+from trueskill import TrueSkill
+
+from game_auth.models import Match, User
+from services.match_history import HistoryReplay, MatchHistoryWriter, history_chunks
+from services.match_results import ingest_results
+
+
+def test_replay_in_chunks_matches_rating_one_match_after_another():
+    env = TrueSkill(mu=30, sigma=5, beta=3, tau=0.1, draw_probability=0)
+    rng = np.random.default_rng(11)
+    matches = [tuple(rng.choice(20, 2, replace=False).tolist()) for _ in range(300)]
+
+    replay = HistoryReplay(env).replay(matches[i : i + 64] for i in range(0, len(matches), 64))
+
+    expected = {}
+    for winner, loser in matches:
+        winner_rating, loser_rating = (expected.get(player, env.create_rating()) for player in (winner, loser))
+        (expected[winner],), (expected[loser],) = env.rate([(winner_rating,), (loser_rating,)])
+    assert replay.matches == len(matches)
+    assert replay.batches < len(matches)
+    for player, mu, sigma in replay.ratings():
+        assert np.allclose((mu, sigma), tuple(expected[player]), rtol=0, atol=1e-6)
+
+
+@pytest.mark.django_db
+def test_rated_matches_are_appended_to_history_in_order():
+    winner, loser = (User.objects.create(username=f"user{index}") for index in range(2))
+    ingest_results([(str(winner.uuid), str(loser.uuid))])
+    writer = MatchHistoryWriter(flush_size=2)
+    writer.add(str(loser.uuid), str(winner.uuid))
+    assert not Match.objects.filter(winner=loser.uuid).exists()
+    writer.add(str(winner.uuid), str(uuid.uuid4()))
+
+    history = [match for chunk in history_chunks(2) for match in chunk]
+    assert history[:2] == [(winner.uuid, loser.uuid), (loser.uuid, winner.uuid)]
+    assert len(history) == 3
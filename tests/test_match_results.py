@@ -0,0 +1,77 @@
+import pytest
+from django.db import DatabaseError
+from rest_framework.test import APIClient
+
+from game_auth.models import Match, User
+from services.match_results import ingest_results
+from services.rating_writer import rating_writer
+
+
+@pytest.fixture
+def players():
+    return [User.objects.create(username=f"player{index}") for index in range(3)]
+
+
+@pytest.fixture
+def admin_client():
+    client = APIClient()
+    client.force_authenticate(User.objects.create_superuser(username="admin", password="admin"))
+    return client
+
+
+def results(*matches):
+    return {"results": [{"players": [str(winner.uuid), str(loser.uuid)]} for winner, loser in matches]}
+
+
+def mu_sigma(users):
+    return [tuple(User.objects.filter(uuid=user.uuid).values_list("mu", "sigma").get()) for user in users]
+
+
+@pytest.mark.django_db
+def test_bulk_results_are_rated_and_reported(admin_client, players):
+    first, second, third = players
+    response = admin_client.post("/api/matches/bulk/", results((first, second), (third, first)), format="json")
+    assert response.status_code == 201
+    assert {key: response.json()[key] for key in ("matches", "players", "batches")} == {
+        "matches": 2,
+        "players": 3,
+        "batches": 2,
+    }
+    _, second_mu, third_mu = (mu for mu, _ in mu_sigma(players))
+    assert second_mu < first.mu < third_mu
+    assert Match.objects.filter(winner__in=[first.uuid, third.uuid]).count() == 2
+
+
+@pytest.mark.django_db
+def test_bulk_results_reject_unknown_and_duplicate_players(admin_client, players):
+    first, second, _ = players
+    unknown = User(username="unknown")
+    response = admin_client.post("/api/matches/bulk/", results((first, unknown)), format="json")
+    assert response.status_code == 400
+    assert str(unknown.uuid) in response.json()["players"][0]
+
+    response = admin_client.post("/api/matches/bulk/", results((first, first)), format="json")
+    assert response.status_code == 400
+    assert mu_sigma([first, second]) == [(first.mu, first.sigma), (second.mu, second.sigma)]
+
+
+@pytest.mark.django_db
+def test_bulk_results_are_only_for_admins(players):
+    first, second, _ = players
+    response = APIClient().post("/api/matches/bulk/", results((first, second)), format="json")
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_failed_ingest_rolls_back_every_match(monkeypatch, players):
+    first, second, third = players
+    rating_writer.restore({str(third.uuid): (30, 4)})
+
+    def bulk_create(*args, **kwargs):
+        raise DatabaseError("connection lost")
+
+    monkeypatch.setattr(Match.objects, "bulk_create", bulk_create)
+    with pytest.raises(DatabaseError):
+        ingest_results([(str(first.uuid), str(second.uuid)), (str(third.uuid), str(first.uuid))])
+    assert mu_sigma(players) == [(user.mu, user.sigma) for user in players]
+    assert rating_writer.take([str(third.uuid)]) == {str(third.uuid): (30, 4)}
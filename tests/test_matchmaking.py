@@ -1,9 +1,20 @@
+import asyncio
+import uuid
+
+import msgpack
 import pytest
+from asgiref.testing import ApplicationCommunicator
 from channels.db import database_sync_to_async
 from channels.testing import WebsocketCommunicator
 
 from conf.asgi import application
+from conf.settings import MATCHMAKING_WORKER_CHANNEL
 from game_auth.models import User
+from services.matchmaking_scheduler import scheduler
+from services.room_store import rooms
+from services.tasks import background_tasks
+from services.user_matchmaking import MM
+from workers.matchmaker import MatchmakerConsumer
 
 
 @database_sync_to_async
@@ -18,4 +29,117 @@ async def test_connection():
     assert not len(await get_all_users_from_db())
     connected, _ = await communicator.connect()
     assert connected
+    # new User is saved only when the first match is searched
+    assert not len(await get_all_users_from_db())
+
+    await communicator.send_json_to({"type": "matchmaking", "message": {"type": "find_match"}})
+    assert (await communicator.receive_json_from())["type"] == "OK"
     assert len(await get_all_users_from_db())
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_reconnect_with_token_resumes_user():
+    communicator = WebsocketCommunicator(application, "/ws/basic")
+    await communicator.connect()
+    await communicator.send_json_to({"type": "introduced"})
+    introduced = (await communicator.receive_json_from())["message"]
+    await communicator.disconnect()
+
+    communicator = WebsocketCommunicator(application, f"/ws/basic?token={introduced['token']}")
+    await communicator.connect()
+    await communicator.send_json_to({"type": "introduced"})
+    assert (await communicator.receive_json_from())["message"]["user"] == introduced["user"]
+    await communicator.disconnect()
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_msgpack_connection_gets_binary_frames():
+    communicator = WebsocketCommunicator(application, "/ws/basic?codec=msgpack")
+    await communicator.connect()
+    await communicator.send_to(bytes_data=msgpack.packb({"type": "introduced"}))
+    response = msgpack.unpackb(await communicator.receive_from())
+    assert response["type"] == "introduced"
+    assert isinstance(response["message"], dict)
+    await communicator.disconnect()
+
+
+@pytest.mark.parametrize("search_times", [0, 10, 30, 49])
+def test_mu_window_contains_every_enemy_above_threshold(search_times):
+    threshold = MM.get_threshold(search_times)
+    user_mu, user_sigma = 25, 3
+    min_mu, max_mu = MM.get_mu_window(user_mu, user_sigma, threshold)
+    for enemy_mu in range(-50, 100):
+        for enemy_sigma in (0.5, 2, 5, 8.333):
+            prob = MM.get_match_probability((user_mu, user_sigma), (enemy_mu, enemy_sigma))
+            if prob > threshold:
+                assert min_mu <= enemy_mu <= max_mu
+
+
+@pytest.mark.asyncio
+async def test_room_is_popped_once_by_any_member():
+    room_id = await rooms.create(["user1", "user2"])
+    assert await rooms.get("user2") == (room_id, ["user1", "user2"])
+
+    assert await rooms.pop("user2") == (room_id, ["user1", "user2"])
+    assert await rooms.pop("user1") is None
+    assert await rooms.get("user1") is None
+
+    await rooms.create(["user1", "user2"])
+    next_room_id = await rooms.create(["user1", "user3"])
+    await rooms.pop("user2")
+    assert await rooms.get("user1") == (next_room_id, ["user1", "user3"])
+
+
+@pytest.mark.asyncio
+async def test_matchmaker_worker_joins_and_leaves_queue():
+    worker = ApplicationCommunicator(MatchmakerConsumer(), {"type": "channel", "channel": MATCHMAKING_WORKER_CHANNEL})
+    user_uuid = str(uuid.uuid4())
+    shard = scheduler.queue.shard_for(25)
+
+    async def waiting():
+        assert await worker.receive_nothing()
+        return user_uuid in [user["uuid"] for user in await shard.oldest(1000)]
+
+    await worker.send_input({"type": "matchmaker.join", "user": user_uuid, "mu": 25, "sigma": 8, "mode": "default"})
+    assert await waiting()
+    await worker.send_input({"type": "matchmaker.leave", "user": user_uuid})
+    assert not await waiting()
+    worker.stop()
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_second_find_match_replaces_search_and_disconnect_cancels_it():
+    communicator = WebsocketCommunicator(application, "/ws/basic")
+    await communicator.connect()
+    for _ in range(2):
+        await communicator.send_json_to({"type": "matchmaking", "message": {"type": "find_match"}})
+        assert (await communicator.receive_json_from())["type"] == "OK"
+    await asyncio.sleep(0.01)
+    assert background_tasks.counts() == {"search": 1}
+
+    await communicator.disconnect()
+    await asyncio.sleep(0.01)
+    assert len(background_tasks) == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.asyncio
+async def test_disconnect_leaves_queue_only_after_find_match(monkeypatch):
+    left = []
+
+    async def leave(user_uuid):
+        left.append(user_uuid)
+
+    monkeypatch.setattr(scheduler, "leave", leave)
+    for searches in (False, True):
+        communicator = WebsocketCommunicator(application, "/ws/basic")
+        await communicator.connect()
+        if searches:
+            await communicator.send_json_to({"type": "matchmaking", "message": {"type": "find_match"}})
+            await communicator.receive_json_from()
+        await communicator.disconnect()
+    assert len(left) == 1
@@ -0,0 +1,29 @@
+from services.metrics import Counter, Histogram, render
+
+
+def test_render_counter_with_labels():
+    messages = Counter("messages_total", "Messages", labels=("type",))
+    messages.labels("find_match").inc()
+    messages.labels("find_match").inc(2)
+    messages.labels('say "hi"').inc()
+
+    assert render([messages]).splitlines() == [
+        "# HELP messages_total Messages",
+        "# TYPE messages_total counter",
+        'messages_total{type="find_match"} 3',
+        'messages_total{type="say \\"hi\\""} 1',
+    ]
+
+
+def test_render_histogram_buckets_are_cumulative():
+    seconds = Histogram("tick_seconds", "Tick", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        seconds.observe(value)
+
+    assert render([seconds]).splitlines()[2:] == [
+        'tick_seconds_bucket{le="0.1"} 2',
+        'tick_seconds_bucket{le="1"} 3',
+        'tick_seconds_bucket{le="+Inf"} 4',
+        "tick_seconds_sum 3.65",
+        "tick_seconds_count 4",
+    ]
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from services.pairing import GREEDY, OPTIMAL, PAIRING_MODES, WINDOWED_GREEDY
+from services.user_matchmaking import MM
+
+
+def make_users(*mus):
+    return [{"uuid": str(index), "mu": mu, "sigma": 1} for index, mu in enumerate(mus)]
+
+
+def by_distance(user, users):
+    return sorted(users, key=lambda enemy: abs(enemy["mu"] - user["mu"]))
+
+
+@pytest.fixture
+def queue():
+    """Nearest enemy of the longest waiting user is the only enemy of someone else"""
+    users = make_users(25, 24, 17.5, 31.5)
+    candidates = [by_distance(user, users) for user in users]
+    search_times = {user["uuid"]: 0 for user in users}
+    return users, candidates, search_times
+
+
+@pytest.mark.parametrize("mode", [GREEDY, WINDOWED_GREEDY, OPTIMAL])
+def test_pairs_are_disjoint_and_above_threshold(mode, queue):
+    pairs = PAIRING_MODES[mode](*queue)
+    uuids = [user["uuid"] for pair in pairs for user in pair]
+    assert pairs
+    assert len(uuids) == len(set(uuids))
+    for user, enemy in pairs:
+        prob = MM.get_match_probability((user["mu"], user["sigma"]), (enemy["mu"], enemy["sigma"]))
+        assert prob > MM.get_threshold(0)
+
+
+def test_optimal_pairs_more_users_than_greedy(queue):
+    assert len(PAIRING_MODES[GREEDY](*queue)) == 1
+    assert len(PAIRING_MODES[WINDOWED_GREEDY](*queue)) == 1
+    assert len(PAIRING_MODES[OPTIMAL](*queue)) == 2
+
+
+def test_waiting_relaxes_threshold(queue):
+    users, candidates, search_times = queue
+    users[2]["mu"] = 10
+    assert {user["uuid"] for pair in PAIRING_MODES[OPTIMAL](*queue) for user in pair} == {"0", "1"}
+    search_times["2"] = 49
+    assert len(PAIRING_MODES[OPTIMAL](users, candidates, search_times)) == 2
+
+
+def allowed_quality(user, enemy, search_times):
+    prob = MM.get_match_probability((user["mu"], user["sigma"]), (enemy["mu"], enemy["sigma"]))
+    threshold = min(MM.get_threshold(search_times[player["uuid"]]) for player in (user, enemy))
+    return prob if prob > threshold else None
+
+
+def best_by_brute_force(users, search_times, reach, free=None):
+    """(pairs count, total quality) of the best pairing of users at most ``reach`` apart in mu order"""
+    users = sorted(users, key=lambda user: user["mu"])
+    free = list(range(len(users))) if free is None else free
+    if not free:
+        return 0, 0.0
+    first, rest = free[0], free[1:]
+    options = [best_by_brute_force(users, search_times, reach, rest)]
+    enemies = [j for j in rest if j - first <= reach]
+    for j, prob in zip(enemies, (allowed_quality(users[first], users[j], search_times) for j in enemies)):
+        if prob is not None:
+            count, total = best_by_brute_force(users, search_times, reach, [index for index in rest if index != j])
+            options.append((count + 1, total + prob))
+    return max(options)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_optimal_is_best_pairing_within_reach(seed):
+    rnd = random.Random(seed)
+    users = [{"uuid": str(index), "mu": rnd.uniform(15, 35), "sigma": rnd.uniform(1, 4)} for index in range(8)]
+    search_times = {user["uuid"]: rnd.choice((0, 0, 10, 30)) for user in users}
+    pairs = PAIRING_MODES[OPTIMAL](users, [users] * len(users), search_times)
+    count, total = best_by_brute_force(users, search_times, reach=3)
+    quality = sum(MM.get_match_probability((u["mu"], u["sigma"]), (e["mu"], e["sigma"])) for u, e in pairs)
+    assert len(pairs) == count
+    assert quality == pytest.approx(total)
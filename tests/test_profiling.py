@@ -0,0 +1,28 @@
+import logging
+
+from services.profiling import DB, OTHER, Profiler
+
+
+def test_one_in_n_messages_is_traced_with_breakdown():
+    profiler = Profiler(sample_rate=2, slow_seconds=60)
+    for _ in range(4):
+        with profiler.message() as trace:
+            profiler.rename("matchmaking")
+            with profiler.section(DB):
+                pass
+
+    stats = profiler.stats()["matchmaking"]
+    assert stats["count"] == 2
+    assert stats[DB] + stats[OTHER] <= stats["seconds"] + 1e-9
+    assert trace is not None
+
+
+def test_slow_handler_is_logged(caplog):
+    profiler = Profiler(sample_rate=1, slow_seconds=0)
+    with caplog.at_level(logging.WARNING, logger="services.profiling"):
+        with profiler.message("introduced"):
+            with profiler.section(DB):
+                pass
+
+    assert "Slow handler introduced" in caplog.text
+    assert f"{DB}=" in caplog.text
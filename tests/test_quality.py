@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from trueskill import Rating, quality
+
+from services.quality import quality_matrix, quality_vector
+
+TOLERANCE = 1e-9
+
+
+@pytest.fixture
+def ratings():
+    rng = np.random.default_rng(42)
+    return rng.uniform(0, 50, 50), rng.uniform(0.5, 8.333, 50)
+
+
+def test_quality_vector_matches_trueskill(ratings):
+    mus, sigmas = ratings
+    probs = quality_vector(25, 8.333, mus, sigmas)
+    expected = [quality([(Rating(25, 8.333),), (Rating(mu, sigma),)]) for mu, sigma in zip(mus, sigmas)]
+    assert probs.shape == (len(mus),)
+    assert np.allclose(probs, expected, rtol=0, atol=TOLERANCE)
+
+
+def test_quality_matrix_matches_trueskill(ratings):
+    mus, sigmas = (x[:10] for x in ratings)
+    matrix = quality_matrix(mus, sigmas)
+    expected = [
+        [quality([(Rating(mu_a, sigma_a),), (Rating(mu_b, sigma_b),)]) for mu_b, sigma_b in zip(mus, sigmas)]
+        for mu_a, sigma_a in zip(mus, sigmas)
+    ]
+    assert matrix.shape == (10, 10)
+    assert np.allclose(matrix, expected, rtol=0, atol=TOLERANCE)
+    assert np.allclose(matrix, matrix.T)
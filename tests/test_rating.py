@@ -0,0 +1,141 @@
+import asyncio
+
+import numpy as np
+import pytest
+from django.db import DatabaseError
+from trueskill import Rating, rate
+
+from game_auth.models import User, UserQuerySet
+from services.rating import independent_batches, rate_1vs1
+from services.rating_writer import RatingWriteBehind
+from services.user_matchmaking import ComputePool, rate_1vs1_batch
+
+TOLERANCE = 1e-9
+
+
+@pytest.fixture
+def matches():
+    rng = np.random.default_rng(7)
+    size = 200
+    return (
+        rng.uniform(0, 50, size),
+        rng.uniform(0.5, 8.333, size),
+        rng.uniform(0, 50, size),
+        rng.uniform(0.5, 8.333, size),
+    )
+
+
+def test_rate_1vs1_matches_trueskill(matches):
+    result = rate_1vs1(*matches)
+    expected = []
+    for winner_mu, winner_sigma, loser_mu, loser_sigma in zip(*matches):
+        (winner,), (loser,) = rate([(Rating(winner_mu, winner_sigma),), (Rating(loser_mu, loser_sigma),)])
+        expected.append((winner.mu, winner.sigma, loser.mu, loser.sigma))
+    for got, want in zip(result, np.array(expected).T):
+        assert got.shape == want.shape
+        assert np.allclose(got, want, rtol=0, atol=TOLERANCE)
+
+
+def test_rate_1vs1_scalars():
+    winner_mu, winner_sigma, loser_mu, loser_sigma = rate_1vs1(25, 8.333, 25, 8.333)
+    (winner,), (loser,) = rate([(Rating(25, 8.333),), (Rating(25, 8.333),)])
+    assert winner_mu == pytest.approx(winner.mu, abs=TOLERANCE)
+    assert loser_sigma == pytest.approx(loser.sigma, abs=TOLERANCE)
+    assert winner_mu > 25 > loser_mu
+
+
+def test_independent_batches_keep_players_order():
+    matches = [("a", "b"), ("c", "d"), ("a", "c"), ("e", "f"), ("b", "d"), ("a", "b")]
+    batches = independent_batches(matches)
+    assert batches == [[0, 1, 3], [2, 4], [5]]
+    for batch in batches:
+        players = [player for index in batch for player in matches[index]]
+        assert len(players) == len(set(players))
+
+
+@pytest.mark.asyncio
+async def test_ratings_submitted_together_are_computed_in_one_batch(matches):
+    calls = []
+
+    def batch_func(items):
+        calls.append(len(items))
+        return rate_1vs1_batch(items)
+
+    pool = ComputePool(workers=0, batch_size=150)
+    results = await asyncio.gather(*(pool.submit(batch_func, match) for match in zip(*matches)))
+    assert calls == [150, 50]
+    assert np.allclose(np.array(results).T, rate_1vs1(*matches), rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.asyncio
+async def test_compute_pool_runs_in_processes_and_inline_when_saturated(matches):
+    items = list(zip(*matches))
+    pool = ComputePool(workers=1, max_pending=1)
+    try:
+        in_pool, inline = await asyncio.gather(pool.run(rate_1vs1_batch, items), pool.run(rate_1vs1_batch, items))
+    finally:
+        pool.close()
+    assert np.allclose(in_pool, inline, rtol=0, atol=TOLERANCE)
+    assert np.allclose(np.array(in_pool).T, rate_1vs1(*matches), rtol=0, atol=TOLERANCE)
+
+
+def rated(user, mu, sigma):
+    user.mu, user.sigma = mu, sigma
+    return user
+
+
+def saved(user):
+    return tuple(User.objects.filter(uuid=user.uuid).values_list("mu", "sigma").get())
+
+
+@pytest.mark.django_db
+def test_rating_writer_collapses_updates_and_flushes_by_size():
+    first, second = (User.objects.create(username=f"user{index}") for index in range(2))
+    writer = RatingWriteBehind(flush_size=2, flush_interval=float("inf"))
+    writer.add(rated(first, 26, 7))
+    writer.add(rated(first, 27, 6))
+    assert len(writer) == 1
+    assert saved(first) != (27, 6)
+
+    writer.add(rated(second, 20, 5))
+    assert len(writer) == 0
+    assert (saved(first), saved(second)) == ((27, 6), (20, 5))
+
+
+@pytest.mark.django_db
+def test_rating_writer_flushes_by_time():
+    user = User.objects.create(username="user")
+    writer = RatingWriteBehind(flush_size=100, flush_interval=0)
+    writer.add(rated(user, 30, 4))
+    assert len(writer) == 0
+    assert saved(user) == (30, 4)
+
+
+@pytest.mark.django_db
+def test_rating_writer_restores_pending_when_save_fails(monkeypatch):
+    user = User.objects.create(username="user")
+    writer = RatingWriteBehind(flush_size=100, flush_interval=float("inf"))
+    writer.add(rated(user, 30, 4))
+
+    def bulk_update(*args, **kwargs):
+        raise DatabaseError("connection lost")
+
+    monkeypatch.setattr(UserQuerySet, "bulk_update", bulk_update)
+    with pytest.raises(DatabaseError):
+        writer.flush()
+    assert len(writer) == 1
+
+    monkeypatch.undo()
+    assert writer.flush() == 1
+    assert saved(user) == (30, 4)
+
+
+@pytest.mark.django_db
+def test_rating_writer_applies_pending_ratings_to_loaded_users():
+    user, other = (User.objects.create(username=f"user{index}") for index in range(2))
+    writer = RatingWriteBehind(flush_size=100, flush_interval=float("inf"))
+    writer.add(rated(User.objects.get(uuid=user.uuid), 30, 4))
+
+    loaded = list(User.objects.filter(uuid__in=[user.uuid, other.uuid]).order_by("username"))
+    writer.apply(loaded)
+    assert [(player.mu, player.sigma) for player in loaded] == [(30, 4), (other.mu, other.sigma)]
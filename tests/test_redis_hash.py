@@ -0,0 +1,59 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from services.redis_hash import AsyncRedisHMapMatchmakingStorage
+from services.redis_pool import get_redis
+
+
+@pytest.fixture
+def storage():
+    return AsyncRedisHMapMatchmakingStorage(f"TestQueue{uuid.uuid4().hex}")
+
+
+def make_users(*mus):
+    return [SimpleNamespace(uuid=uuid.uuid4(), mu=mu, sigma=1) for mu in mus]
+
+
+async def index_sizes(storage):
+    redis_ = await get_redis()
+    return [await redis_.zcard(index) for index in (storage.mu_index, storage.joined_index, storage.seen_index)]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_adds_of_one_user_add_it_once(storage):
+    (user,) = make_users(25)
+    added = await asyncio.gather(*(storage.add_if_not_exists(user) for _ in range(10)))
+    assert sorted(added) == [False] * 9 + [True]
+    assert await storage.length() == 1
+    assert await index_sizes(storage) == [1, 1, 1]
+
+
+@pytest.mark.asyncio
+async def test_windows_are_fetched_nearest_first_and_limited(storage):
+    users = make_users(10, 20, 24, 25, 27, 31, 40)
+    for user in users:
+        await storage.add_if_not_exists(user)
+
+    near, low, empty = await storage.windows([(25, 20, 30), (11, float("-inf"), 15), (50, 45, 55)], limit=2)
+    # at most 2 users on each side of the center, 20 is behind 25 and 24
+    assert [user["mu"] for user in near] == [25, 24, 27]
+    assert [user["mu"] for user in low] == [10]
+    assert empty == []
+    assert near[0]["uuid"] == str(users[3].uuid)
+    assert await storage.windows([], limit=2) == []
+
+
+@pytest.mark.asyncio
+async def test_popped_users_leave_hash_and_every_index(storage):
+    users = make_users(20, 25, 30)
+    for user in users:
+        await storage.add_if_not_exists(user)
+
+    await storage.pop_users(users[0], {"uuid": str(users[1].uuid)})
+    assert [user["uuid"] for user in await storage.oldest(10)] == [str(users[2].uuid)]
+    assert [[user["mu"] for user in window] for window in await storage.windows([(25, 0, 50)], limit=10)] == [[30]]
+    assert await index_sizes(storage) == [1, 1, 1]
+    assert not await storage.touch(str(users[0].uuid))
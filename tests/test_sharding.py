@@ -0,0 +1,143 @@
+import asyncio
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from services.matchmaking_scheduler import MatchmakingScheduler, ShardedScheduler
+from services.sharding import ShardedQueue
+
+
+def test_band_is_deterministic_and_open_ended():
+    queue = ShardedQueue("TestShards", modes=("default", "ranked"), shard_count=4, band_width=8)
+    assert [queue.band(mu) for mu in (-100, 16.9, 17, 24.9, 25, 32.9, 33, 100)] == [0, 0, 1, 1, 2, 2, 3, 3]
+    assert queue.shard_for(25, "ranked").name == "TestShards:ranked:2"
+    with pytest.raises(KeyError):
+        queue.shard_for(25, "unknown")
+
+
+def test_every_shard_has_one_owner():
+    queue = ShardedQueue("TestShards", modes=("default", "ranked"), shard_count=4, band_width=8)
+    owned = [shard.name for index in range(3) for shard in queue.owned(index, 3)]
+    assert sorted(owned) == sorted(queue.shards)
+
+
+@pytest.mark.asyncio
+async def test_users_near_band_boundary_are_matched_across_it():
+    queue = ShardedQueue(f"TestShards{uuid.uuid4().hex}", shard_count=4, band_width=8)
+    user = SimpleNamespace(uuid=uuid.uuid4(), mu=24.5, sigma=1)
+    enemy = SimpleNamespace(uuid=uuid.uuid4(), mu=25.5, sigma=1)
+    for player in (user, enemy):
+        await queue.add_if_not_exists(player)
+    assert queue.shard_for(user.mu) is not queue.shard_for(enemy.mu)
+
+    matches = []
+
+    async def on_match(*users_uuids):
+        matches.append(set(users_uuids))
+
+    shard = queue.shard_for(user.mu)
+    assert await MatchmakingScheduler(shard, on_match=on_match).tick() == 0
+    assert matches == [{str(user.uuid), str(enemy.uuid)}]
+    assert await queue.shard_for(enemy.mu).length() == 0
+
+
+@pytest.mark.asyncio
+async def test_pair_across_shards_is_claimed_once():
+    queue = ShardedQueue(f"TestShards{uuid.uuid4().hex}", shard_count=4, band_width=8)
+    user, enemy, other = (SimpleNamespace(uuid=uuid.uuid4(), mu=mu, sigma=1) for mu in (24.5, 25.5, 25.6))
+    for player in (user, enemy, other):
+        await queue.add_if_not_exists(player)
+    low, high = queue.shard_for(user.mu), queue.shard_for(enemy.mu)
+    (user_entry,), (enemy_entry, other_entry) = await low.oldest(10), await high.oldest(10)
+
+    assert await queue.claim_pairs([(user_entry, enemy_entry), (other_entry, user_entry)]) == [True, False]
+    assert await low.length() == 0
+    assert [entry["uuid"] for entry in await high.oldest(10)] == [str(other.uuid)]
+    assert await low.get_enemy(str(user.uuid)) == str(enemy.uuid)
+    assert await queue.claim_pairs([(user_entry, enemy_entry)]) == [False]
+
+
+@pytest.mark.asyncio
+async def test_started_process_matches_users_joined_through_other_processes():
+    queue = ShardedQueue(f"TestShards{uuid.uuid4().hex}", shard_count=2, band_width=8)
+    players = [SimpleNamespace(uuid=uuid.uuid4(), mu=mu, sigma=1) for mu in (10, 10, 40, 40)]
+    for player in players:
+        await queue.add_if_not_exists(player)
+    schedulers = ShardedScheduler(queue, process_index=0, process_count=2)
+    matches = []
+
+    async def on_match(*users_uuids):
+        matches.append(set(users_uuids))
+
+    schedulers.on_match = on_match
+    schedulers.start()
+    await asyncio.sleep(0.05)
+    for scheduler in schedulers.schedulers.values():
+        scheduler._task.cancel()
+    owned = {shard.name for shard in queue.owned(0, 2)}
+    assert matches == [{str(player.uuid) for player in players[:2]}]
+    assert [queue.shard_for(mu).name in owned for mu in (10, 40)] == [True, False]
+    assert await queue.shard_for(40).length() == 2
+
+
+@pytest.mark.asyncio
+async def test_users_not_seen_are_swept_and_leaving_users_are_removed():
+    queue = ShardedQueue(f"TestShards{uuid.uuid4().hex}", shard_count=1)
+    stale, alive, leaving = (SimpleNamespace(uuid=uuid.uuid4(), mu=25, sigma=8) for _ in range(3))
+    for player in (stale, alive, leaving):
+        await queue.add_if_not_exists(player)
+    shard = queue.shard_for(25)
+    await asyncio.sleep(0.01)
+    assert await queue.touch(str(alive.uuid), alive.mu)
+
+    await queue.remove(str(leaving.uuid))
+    assert not await queue.touch(str(leaving.uuid), leaving.mu)
+    scheduler = MatchmakingScheduler(shard, entry_ttl=0.005, sweep_interval=0)
+    assert await scheduler.sweep(time.time()) == 1
+    assert [user["uuid"] for user in await shard.oldest(10)] == [str(alive.uuid)]
+
+
+@pytest.mark.asyncio
+async def test_started_scheduler_sweeps_users_of_crashed_servers_without_joins():
+    queue = ShardedQueue(f"TestShards{uuid.uuid4().hex}", shard_count=1)
+    await queue.add_if_not_exists(SimpleNamespace(uuid=uuid.uuid4(), mu=25, sigma=8))
+    shard = queue.shard_for(25)
+    schedulers = ShardedScheduler(queue)
+    schedulers.schedulers[shard.name] = MatchmakingScheduler(
+        shard, tick_interval=0.01, entry_ttl=0.02, sweep_interval=0
+    )
+    schedulers.start()
+    await asyncio.wait_for(schedulers.schedulers[shard.name]._task, 1)
+    assert await shard.length() == 0
+
+
+@pytest.mark.asyncio
+async def test_pairs_not_started_are_requeued_and_dont_stop_other_pairs():
+    queue = ShardedQueue(f"TestShards{uuid.uuid4().hex}", shard_count=1)
+    # four pairs, too far apart in mu to be paired otherwise
+    players = [SimpleNamespace(uuid=uuid.uuid4(), mu=mu, sigma=1) for mu in (10, 10, 25, 25, 40, 40, 55, 55)]
+    for player in players:
+        await queue.add_if_not_exists(player)
+    shard = queue.shard_for(25)
+    joined = {user["uuid"]: user["joined_at"] for user in await shard.oldest(10)}
+    failing, left, waiting, gone = (str(players[index].uuid) for index in (0, 2, 3, 4))
+
+    async def on_match(*users_uuids):
+        if failing in users_uuids:
+            raise ConnectionError("channel layer is down")
+        if left in users_uuids:
+            return [waiting]
+        if gone in users_uuids:
+            return []
+
+    scheduler = MatchmakingScheduler(shard, on_match=on_match)
+    observed = []
+    scheduler.observe_match = lambda user, enemy, now: observed.append({user["uuid"], enemy["uuid"]})
+    await scheduler.tick()
+    assert observed == [{str(players[6].uuid), str(players[7].uuid)}]
+    requeued = [str(player.uuid) for player in players[:2]] + [waiting]
+    assert sorted((user["uuid"], user["joined_at"]) for user in await shard.oldest(10)) == sorted(
+        (user_uuid, joined[user_uuid]) for user_uuid in requeued
+    )
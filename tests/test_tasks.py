@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services.matchmaking_scheduler import MatchmakingScheduler
+from services.tasks import TaskGroup, TaskLimitError, TaskRegistry, service_tasks
+
+
+async def forever():
+    await asyncio.Event().wait()
+
+
+@pytest.mark.asyncio
+async def test_task_of_same_name_replaces_running_one_and_cancel_stops_all():
+    registry = TaskRegistry(limit=10)
+    group = TaskGroup(registry)
+    first = group.start("search", forever())
+    second = group.start("search", forever())
+    group.start("other", forever())
+    await asyncio.wait([first])
+    assert first.cancelled()
+    assert registry.counts() == {"search": 1, "other": 1}
+
+    assert group.cancel()
+    await asyncio.wait([second])
+    assert second.cancelled()
+    assert len(group) == len(registry) == 0
+    assert not group.cancel()
+
+
+@pytest.mark.asyncio
+async def test_registry_limit_is_shared_by_groups_and_failures_are_forgotten(caplog):
+    registry = TaskRegistry(limit=1)
+    first, second = TaskGroup(registry), TaskGroup(registry)
+    task = first.start("search", forever())
+    with pytest.raises(TaskLimitError):
+        second.start("search", forever())
+    first.cancel()
+    await asyncio.wait([task])
+
+    async def fail():
+        raise ValueError("lost connection")
+
+    await asyncio.wait([second.start("search", fail())])
+    assert len(registry) == 0
+    assert "search" not in second
+    assert "Background task search failed" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_scheduler_keeps_running_after_failed_rounds(caplog):
+    async def sweep(cutoff):
+        raise ConnectionError("redis is down")
+
+    storage = SimpleNamespace(name="TestQueue", sweep=sweep)
+    scheduler = MatchmakingScheduler(storage, tick_interval=0.001, sweep_interval=0)
+    scheduler.ensure_running()
+    assert service_tasks.counts().get("matchmaking_scheduler")
+    await asyncio.sleep(0.05)
+    assert not scheduler._task.done()
+    assert caplog.text.count("Matchmaking round of TestQueue failed") > 1
+    assert "redis is down" in caplog.text
+
+    scheduler._task.cancel()
+    await asyncio.wait([scheduler._task])
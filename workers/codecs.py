@@ -0,0 +1,68 @@
+"""
+Wire formats of websocket messages.
+
+A connection picks its codec with ``ws/basic?codec=msgpack``, JSON is the default.
+JSON uses ``orjson`` when it is installed, MessagePack frames are sent as ``bytes_data``.
+"""
+import json
+from typing import Any, Dict, Optional, Union
+from urllib.parse import parse_qs
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+Frame = Union[str, bytes]
+
+
+class JsonCodec:
+    name = "json"
+    binary = False
+
+    def encode(self, data: Any) -> str:
+        if orjson is not None:
+            return orjson.dumps(data).decode()
+        return json.dumps(data, separators=(",", ":"))
+
+    def decode(self, frame: Frame) -> Any:
+        """Raises ValueError for malformed frame"""
+        if orjson is not None:
+            return orjson.loads(frame)
+        return json.loads(frame)
+
+
+class MsgPackCodec:
+    name = "msgpack"
+    binary = True
+
+    def encode(self, data: Any) -> bytes:
+        return msgpack.packb(data)
+
+    def decode(self, frame: Frame) -> Any:
+        """Raises ValueError for malformed frame"""
+        if isinstance(frame, str):
+            frame = frame.encode()
+        return msgpack.unpackb(frame)
+
+
+json_codec = JsonCodec()
+CODECS = {json_codec.name: json_codec}
+if msgpack is not None:
+    CODECS[MsgPackCodec.name] = MsgPackCodec()
+
+
+def frame_kwargs(codec: Union[JsonCodec, MsgPackCodec], frame: Frame) -> Dict[str, Frame]:
+    """Keyword arguments of ``AsyncWebsocketConsumer.send`` for encoded frame"""
+    return {"bytes_data": frame} if codec.binary else {"text_data": frame}
+
+
+def codec_for(scope: dict) -> Union[JsonCodec, MsgPackCodec]:
+    """Codec asked by connection, JSON if it is unknown"""
+    name: Optional[str] = parse_qs(scope.get("query_string", b"").decode()).get("codec", [None])[0]
+    return CODECS.get(name, json_codec)
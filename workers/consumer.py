@@ -1,11 +1,15 @@
-import json
-from json import JSONDecodeError
-
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.utils.functional import cached_property
 
+from services.metrics import histogram
+from services.profiling import SERIALIZATION, profiler
+from services.tasks import TaskGroup
+from workers.codecs import codec_for, frame_kwargs
 from workers.handler import matchmaking, unknown_module, introduced_module
 from workers.models import Msg
 
+message_seconds = histogram("websocket_message_seconds", "Handling of one websocket message", labels=("type",))
+
 
 @matchmaking
 @unknown_module
@@ -13,16 +17,37 @@ from workers.models import Msg
 class Consumer(AsyncWebsocketConsumer):
     handlers = {}
 
+    @cached_property
+    def codec(self):
+        return codec_for(self.scope)
+
+    @cached_property
+    def tasks(self):
+        """Background tasks of this connection, cancelled on disconnect"""
+        return TaskGroup()
+
     async def receive(self, text_data=None, bytes_data=None):
-        try:
-            content = json.loads(text_data)
-        except JSONDecodeError as err:
-            error = Msg(type="error", message={"raw_data": text_data, "error": err.args}).json
-            await self.send(text_data=error)
-        else:
-            await self.message_handler(content)
+        with profiler.message():
+            try:
+                with profiler.section(SERIALIZATION):
+                    content = self.codec.decode(bytes_data if text_data is None else text_data)
+            except ValueError as err:
+                raw_data = bytes_data.hex() if text_data is None else text_data
+                await self.send_msg(Msg(type="error", message={"raw_data": raw_data, "error": err.args}))
+            else:
+                await self.message_handler(content)
 
     async def message_handler(self, content):
-        handler = self.handlers.get(content.get("type"), self.handlers["unknown"])
-        response = await handler(self, content)
-        await self.send(text_data=response)
+        message_type = content.get("type")
+        if message_type not in self.handlers:
+            message_type = "unknown"
+        profiler.rename(message_type)
+        with message_seconds.labels(message_type).time():
+            response = await self.handlers[message_type](self, content)
+        await self.send_msg(response)
+
+    async def send_msg(self, msg: Msg):
+        """Encode once with codec of this connection"""
+        with profiler.section(SERIALIZATION):
+            frame = msg.encode(self.codec)
+        await self.send(**frame_kwargs(self.codec, frame))
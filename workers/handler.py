@@ -1,103 +1,196 @@
 import asyncio
-import uuid
-from typing import Type
+from typing import List, Optional, Sequence
+from urllib.parse import parse_qs
 
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.layers import get_channel_layer
 
-from game_auth.models import User, Room
+from conf.settings import (
+    MATCH_HISTORY_ROOMS,
+    MATCHMAKING_DEFAULT_MODE,
+    MATCHMAKING_HEARTBEAT_INTERVAL,
+    MATCHMAKING_WORKER,
+)
+from game_auth.models import User, Room, user_channel_names
+from services.identity import identity
+from services.match_history import match_history
+from services.matchmaking_scheduler import scheduler
+from services.metrics import gauge
+from services.profiling import CHANNEL_LAYER, DB, profiled, profiler
+from services.rating_writer import rating_writer
+from services.room_store import rooms
+from services.tasks import TaskLimitError
 from services.user_matchmaking import MM
-from workers.models import Msg
+from workers.matchmaker import request_join, request_leave
+from workers.models import ConstantMsg, Msg
+
+OK = ConstantMsg(type="OK", message={"success": "True"})
+UNKNOWN_TYPE = ConstantMsg(type="error", message={"error": "unknown type message"})
+UNKNOWN_MODE = ConstantMsg(type="error", message={"error": "unknown game mode"})
+BUSY = ConstantMsg(type="error", message={"error": "matchmaking is busy, try again later"})
+
+SEARCH = "search"
+
+connections = gauge("websocket_connections", "Open websocket connections")
 
 
 def matchmaking(consumer: AsyncWebsocketConsumer.__class__):  # noqa: CCR001
-    async def match(self: AsyncWebsocketConsumer.__class__, content: dict) -> str:
+    async def match(self: AsyncWebsocketConsumer.__class__, content: dict) -> Msg:
         action = content["message"]["type"]
 
         if action == "find_match":
-            await find_enemy_for(self)
+            return await find_enemy_for(self, content["message"].get("mode", MATCHMAKING_DEFAULT_MODE))
         if action == "match_finished":
             await finish_match(self)
 
-        msg = Msg(type="OK", message={"success": "True"})
-        return msg.json
+        return OK
 
-    async def find_enemy_for(self: AsyncWebsocketConsumer.__class__):
+    async def find_enemy_for(self: AsyncWebsocketConsumer.__class__, mode: str) -> Msg:
+        if mode not in scheduler.queue.modes:
+            return UNKNOWN_MODE
         user = self.scope["user"]
-        loop = asyncio.get_event_loop()
-        loop.create_task(MM.find_match_for_user(self, user))
-
-    async def start_match(self: AsyncWebsocketConsumer.__class__, user: Type[User], enemy: Type[User]):
-        user_channel_name = self.channel_name
-        enemy_channel_name = enemy.channel_name
-        await add_users_to_channel_group((user, user_channel_name), (enemy, enemy_channel_name))
+        await identity.ensure_persisted(user)
+        await refresh_rating(user)
+        # a second find_match replaces the running search
+        if self.tasks.cancel(SEARCH):
+            await leave(self, user)
+        try:
+            self.tasks.start(SEARCH, search(self, user, mode))
+        except TaskLimitError:
+            return BUSY
+        return OK
+
+    async def search(self: AsyncWebsocketConsumer.__class__, user: User, mode: str):
+        """Join the queue and keep queue entry of connected User alive until User is matched"""
+        if MATCHMAKING_WORKER:
+            await request_join(self.channel_layer, user, mode)
+        else:
+            await scheduler.join(user, mode)
+        user_uuid, mu = str(user.uuid), user.mu
+        while True:
+            await asyncio.sleep(MATCHMAKING_HEARTBEAT_INTERVAL)
+            if not await scheduler.queue.touch(user_uuid, mu, mode):
+                return
+
+    async def leave(self: AsyncWebsocketConsumer.__class__, user: User):
+        if MATCHMAKING_WORKER:
+            await request_leave(self.channel_layer, user)
+        else:
+            await scheduler.leave(str(user.uuid))
+
+    async def start_match(*users_uuids: str) -> Optional[List[str]]:
+        """
+        Called by matchmaking scheduler for every found pair
+
+        :return: None if match started, else uuids of still connected users to put back in queue
+        """
+        users = await find_users(users_uuids)
+        channel_names = await get_channel_names(users)
+        if len(users) < len(users_uuids) or None in channel_names:
+            return [str(user.uuid) for user, channel_name in zip(users, channel_names) if channel_name is not None]
+        await add_users_to_channel_group(*zip(users, channel_names))
+        return None
 
     async def add_users_to_channel_group(*channel_names):
-        room = await create_new_room()
+        users = [user for user, _ in channel_names]
+        room = await rooms.create([str(user.uuid) for user in users])
+        if MATCH_HISTORY_ROOMS:
+            await save_room(users)
         channel_layer = get_channel_layer()
-        for user, channel_name in channel_names:
-            await add_user_to_room(room, user)
-            await channel_layer.group_add(str(room), channel_name)
+        with profiler.section(CHANNEL_LAYER):
+            for _, channel_name in channel_names:
+                await channel_layer.group_add(room, channel_name)
 
         msg = Msg(
             type="found_match",
-            message={f"user{index}": str(user.uuid) for index, (user, _) in enumerate(channel_names)},
+            message={f"user{index}": str(user.uuid) for index, user in enumerate(users)},
         )
-        main_msg = Msg(type="matchmaking_room_send", message=msg.json)
-
-        # await database_sync_to_async(room.save)()
-        await channel_layer.group_send(str(room), main_msg.raw)
+        main_msg = Msg(type="matchmaking_room_send", message=msg.raw)
+        with profiler.section(CHANNEL_LAYER):
+            await channel_layer.group_send(room, main_msg.raw)
 
     async def discard_user_from_channel_group(self: AsyncWebsocketConsumer.__class__, room_name, users):
-        user = self.scope["user"]
-        channel_names = [u.channel_name for u in users]
-        await delete_room(user.my_room.all())
-        for channel_name in channel_names:
-            await self.channel_layer.group_discard(room_name, channel_name)
+        channel_names = await get_channel_names(users)
+        with profiler.section(CHANNEL_LAYER):
+            for channel_name in filter(None, channel_names):
+                await self.channel_layer.group_discard(room_name, channel_name)
 
     async def finish_match(self: AsyncWebsocketConsumer):
         user = self.scope["user"]
 
-        room, users = await get_room_and_users(user)
-        users = await database_sync_to_async(MM.match_1_vs_1_random_winner)(users)
-        msg = Msg(type="match_finished", message={str(u.uuid): str(u) for u in users})
-        main_msg = Msg(type="matchmaking_room_send", message=msg.json)
-
-        await self.channel_layer.group_send(str(room), main_msg.raw)
-        await discard_user_from_channel_group(self, str(room), users)
-
+        room = await rooms.pop(str(user.uuid))
+        if room is None:
+            return
+        room_name, users_uuids = room
+        users = await find_users(users_uuids)
+        users = await rate_match(users)
+        rating_writer.ensure_running()
+        match_history.ensure_running()
+        msg = Msg(type="match_finished", message={str(u.uuid): {"mu": u.mu, "sigma": u.sigma} for u in users})
+        main_msg = Msg(type="matchmaking_room_send", message=msg.raw)
+
+        with profiler.section(CHANNEL_LAYER):
+            await self.channel_layer.group_send(room_name, main_msg.raw)
+        await discard_user_from_channel_group(self, room_name, users)
+
+    async def get_channel_names(users: Sequence[User]):
+        return await user_channel_names.get_many([str(u.uuid) for u in users])
+
+    @profiled(DB)
     @database_sync_to_async
-    def find_user(user_uuid):
-        return User.objects.get(uuid=user_uuid)
+    def refresh_rating(user):
+        """User may be cached since before the last match"""
+        user.refresh_from_db(fields=["mu", "sigma", "rating"])
+        rating_writer.apply([user])
+        user.rating = MM.calculate_rating(user.mu, user.sigma)
 
+    @profiled(DB)
     @database_sync_to_async
-    def get_all_users_from_db():
-        return User.objects.all()
+    def find_users(users_uuids: Sequence[str]):
+        users = list(User.objects.filter(uuid__in=users_uuids))
+        rating_writer.apply(users)
+        return users
 
-    @database_sync_to_async
-    def create_new_room():
-        return Room.objects.create()
-
-    @database_sync_to_async
-    def add_user_to_room(room, user):
-        return room.users.add(user)
+    async def rate_match(users: Sequence[User]):
+        users, ratings = await MM.rate_1_vs_1_random_winner(users)
+        await update_ratings(users, ratings)
+        return users
 
+    @profiled(DB)
     @database_sync_to_async
-    def delete_room(room):
-        return room.delete()
+    def update_ratings(users: Sequence[User], ratings):
+        MM.update_mu_sigma_for_users(users, ratings)
+        winner, looser = users
+        match_history.add(str(winner.uuid), str(looser.uuid))
 
+    @profiled(DB)
     @database_sync_to_async
-    def get_room_and_users(user):
-        room = user.my_room.first()
-        users = room.users.all()
-        return room, users
+    def save_room(users: Sequence[User]):
+        """Match history only, rooms of running matches are in ``rooms``"""
+        room = Room.objects.create()
+        room.users.add(*users)
+        return room
 
     async def matchmaking_room_send(self, event):
-        await self.send(text_data=event["message"])
+        await self.send_msg(Msg(**event["message"]))
 
+    # closure parent's method
+    old_disconnect = consumer.disconnect
+
+    async def disconnect(self, close_code):
+        """Stop the search and leave the queue if User still searches, this override disconnect method"""
+        if self.tasks.cancel(SEARCH):
+            await leave(self, self.scope["user"])
+        self.tasks.cancel()
+
+        # call parent method
+        await old_disconnect(self, close_code)
+
+    consumer.disconnect = disconnect
     consumer.handlers["matchmaking"] = match
     consumer.handlers["matchmaking"].start_match = start_match
+    scheduler.on_match = start_match
     consumer.matchmaking_room_send = matchmaking_room_send
     return consumer
 
@@ -107,9 +200,8 @@ def unknown_module(
 ) -> AsyncWebsocketConsumer.__class__:
     """module for handle unknown message"""
 
-    async def unknown(*_args, **_kwargs) -> str:
-        msg = Msg(type="error", message={"error": "unknown type message"})
-        return msg.json
+    async def unknown(*_args, **_kwargs) -> Msg:
+        return UNKNOWN_TYPE
 
     consumer.handlers["unknown"] = unknown
     return consumer
@@ -120,10 +212,10 @@ def introduced_module(
 ) -> AsyncWebsocketConsumer.__class__:
     """module for handle introduced"""
 
-    async def introduced(context, *_args) -> str:
+    async def introduced(context, *_args) -> Msg:
+        """``token`` resumes the same User on next connect: ``ws/basic?token=...``"""
         user = context.scope["user"]
-        msg = Msg(type="introduced", message={"user": user.username})
-        return msg.json
+        return Msg(type="introduced", message={"user": user.username, "token": identity.make_token(user)})
 
     consumer.handlers["introduced"] = introduced
 
@@ -132,9 +224,10 @@ def introduced_module(
 
     async def connect(self: AsyncWebsocketConsumer.__class__):
         """this override connect method"""
-        user = await add_user_to_db()
+        user = await identity.resume(get_token(self.scope))
         self.scope["user"] = user
-        user.channel_name = self.channel_name
+        await user_channel_names.register(str(user.uuid), self.channel_name)
+        connections.inc()
 
         # call parent method
         await old_connect(self)
@@ -147,15 +240,16 @@ def introduced_module(
     async def disconnect(self, close_code):
         """this override disconnect method"""
         user = self.scope["user"]
-        del user.channel_name
+        await user_channel_names.unregister(str(user.uuid), self.channel_name)
+        connections.dec()
+        identity.release(user)
 
         # call parent method
         await old_disconnect(self, close_code)
 
-    @database_sync_to_async
-    def add_user_to_db():
-        username = uuid.uuid4()
-        return User.objects.create(username=username, uuid=username)
+    def get_token(scope: dict) -> Optional[str]:
+        query = parse_qs(scope.get("query_string", b"").decode())
+        return query.get("token", [None])[0]
 
     consumer.disconnect = disconnect
     return consumer
@@ -0,0 +1,14 @@
+from channels import DEFAULT_CHANNEL_LAYER
+from channels.management.commands import runworker
+
+from conf.settings import MATCHMAKING_WORKER_CHANNEL
+from workers.matchmaker import MatchmakerWorker
+
+
+class Command(runworker.Command):
+    help = "Run matchmaking worker, schedulers of owned shards match users from startup"
+    worker_class = MatchmakerWorker
+
+    def add_arguments(self, parser):
+        parser.add_argument("--layer", default=DEFAULT_CHANNEL_LAYER, help="channel layer alias")
+        parser.add_argument("channels", nargs="*", default=[MATCHMAKING_WORKER_CHANNEL], help="channels to listen on")
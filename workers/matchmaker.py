@@ -0,0 +1,86 @@
+from typing import NamedTuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from game_auth.models import User
+
+from channels.consumer import AsyncConsumer
+from channels.layers import BaseChannelLayer
+from channels.worker import Worker
+
+from conf.settings import MATCHMAKING_WORKER, MATCHMAKING_WORKER_CHANNEL
+from services.matchmaking_scheduler import scheduler
+
+
+class QueuedUser(NamedTuple):
+    uuid: str
+    mu: float
+    sigma: float
+
+
+class MatchmakerConsumer(AsyncConsumer):
+    """
+    Matchmaking outside of websocket servers: ``python manage.py runmatchmaker``.
+
+    Websocket consumers send join and leave requests to ``MATCHMAKING_WORKER_CHANNEL``,
+    found matches are sent back to users' channel names by ``scheduler.on_match``.
+    Many workers may consume the channel, see ``ShardedScheduler`` for shards they own.
+    """
+
+    async def matchmaker_join(self, event: dict) -> None:
+        user = QueuedUser(event["user"], event["mu"], event["sigma"])
+        await scheduler.join(user, event["mode"])
+
+    async def matchmaker_leave(self, event: dict) -> None:
+        await scheduler.leave(event["user"])
+
+
+class MatchmakerWorker(Worker):
+    """Worker starting schedulers of owned shards before it consumes join and leave requests"""
+
+    async def handle(self) -> None:
+        scheduler.start()
+        await super().handle()
+
+
+class MatchmakingStartup:
+    """
+    ASGI application starting schedulers of owned shards in websocket servers matching users themselves.
+
+    Started on lifespan startup if the server sends it, otherwise with the first connection of the process.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.started = False
+
+    async def __call__(self, scope: dict, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        self.start()
+        return await self.application(scope, receive, send)
+
+    async def lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def start(self) -> None:
+        if not self.started and not MATCHMAKING_WORKER:
+            self.started = True
+            scheduler.start()
+
+
+async def request_join(channel_layer: BaseChannelLayer, user: "User", mode: str) -> None:
+    await channel_layer.send(
+        MATCHMAKING_WORKER_CHANNEL,
+        {"type": "matchmaker.join", "user": str(user.uuid), "mu": user.mu, "sigma": user.sigma, "mode": mode},
+    )
+
+
+async def request_leave(channel_layer: BaseChannelLayer, user: "User") -> None:
+    await channel_layer.send(MATCHMAKING_WORKER_CHANNEL, {"type": "matchmaker.leave", "user": str(user.uuid)})
@@ -1,4 +1,6 @@
-import json
+from typing import Dict, Union
+
+from workers.codecs import Frame, JsonCodec, MsgPackCodec, json_codec
 
 
 class Msg:
@@ -9,10 +11,26 @@ class Msg:
         self.type = type or self.type
         self.message = message or self.message
 
+    def encode(self, codec: Union[JsonCodec, MsgPackCodec] = json_codec) -> Frame:
+        return codec.encode(self.raw)
+
     @property
     def json(self) -> str:
-        return json.dumps({"type": self.type, "message": self.message})
+        return self.encode(json_codec)
 
     @property
     def raw(self) -> dict:
         return {"type": self.type, "message": self.message}
+
+
+class ConstantMsg(Msg):
+    """Msg which never changes, encoded once per codec"""
+
+    def __init__(self, type: str = None, message=None):  # noqa: A002
+        super().__init__(type, message)
+        self._encoded: Dict[str, Frame] = {}
+
+    def encode(self, codec: Union[JsonCodec, MsgPackCodec] = json_codec) -> Frame:
+        if codec.name not in self._encoded:
+            self._encoded[codec.name] = super().encode(codec)
+        return self._encoded[codec.name]